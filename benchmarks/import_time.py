@@ -0,0 +1,60 @@
+''' Checks that importing the plotter modules stays within the import-time budget, and that none of them import their heavy dependencies up front.
+
+Run with: python benchmarks/import_time.py
+
+Every module is imported in a fresh interpreter, repeated a number of times, and the fastest import is compared to IMPORT_BUDGET_MS. Exits with a non-zero exit code if any module is over budget.'''
+
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ['plotter', 'plotter.auxillary', 'plotter.plots', 'plotter.colours', 'plotter.animations', 'plotter.interactive', 'plotter.batch', 'plotter.cache', 'plotter.decimation', 'plotter.density', 'plotter.draft', 'plotter.insets', 'plotter.instrumentation', 'plotter.lifecycle', 'plotter.pool', 'plotter.saving', 'plotter.server', 'plotter.streaming']
+
+HEAVY_MODULES = ['matplotlib', 'numpy', 'PIL', 'mpl_toolkits']
+
+IMPORT_BUDGET_MS = 50
+
+REPEATS = 5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'time': (time.perf_counter() - start)*1000, 'heavy': [name for name in {heavy} if name in sys.modules]}}))
+'''
+
+
+def measure_import(module, repeats=REPEATS):
+    ''' Imports module in a fresh interpreter repeats times. Returns the fastest import time in milliseconds and the heavy modules that were imported along with it.'''
+
+    times = []
+
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module, heavy=HEAVY_MODULES)], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        times.append(result['time'])
+
+    return min(times), result['heavy']
+
+
+def main():
+    failed = False
+
+    for module in MODULES:
+        time, heavy = measure_import(module)
+
+        status = 'ok'
+        if time > IMPORT_BUDGET_MS or heavy:
+            status = 'FAILED'
+            failed = True
+
+        print(f'{module:24s} {time:8.1f} ms  (budget {IMPORT_BUDGET_MS} ms)  {status}' + (f'  imports {", ".join(heavy)}' if heavy else ''))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+''' Benchmarks of the hot paths of plotter. Runs headless (Agg backend) on CPU only.
+
+Run with: python benchmarks/run.py
+
+Every benchmark is run for a range of sizes, and the wall time (fastest of a number of repeats) and peak memory traced by tracemalloc (from a separate run, as tracing slows down the timed ones) are recorded.
+For benchmarks with more than one size, the scaling exponent between the smallest and largest size is computed (time ~ size**exponent) and checked against the maximum exponent of the benchmark,
+so that e.g. quadratic animation saving is caught regardless of the speed of the machine.
+
+Save a baseline with --save-baseline, and later runs are compared against it. The committed benchmarks/baseline.json was made with
+
+    python benchmarks/run.py --save-baseline
+
+and should be remade the same way on the machine the benchmarks are run on, as times depend on the machine. A benchmark fails if it is more than --tolerance times slower (or uses more memory) than the baseline.
+Exits with a non-zero exit code if any benchmark fails.'''
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import plotter.plots as plots
+
+plots.use_headless()
+
+import plotter.animations as animations
+import plotter.auxillary as aux
+import plotter.colours as colours
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from PIL import Image
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def bench_prepare_plot(size, tmp):
+    yield
+
+    fig, ax = plots.prepare_plot({'format_params': {'dpi': 100}})
+    plt.close(fig)
+
+
+def bench_prepare_plot_grid(size, tmp):
+    yield
+
+    fig, axes = plots.prepare_plot({'format_params': {'dpi': 100, 'nrows': size, 'ncols': size}})
+    plt.close(fig)
+
+
+def bench_adjust_plot(size, tmp):
+    fig, ax = plots.prepare_plot({'format_params': {'dpi': 100}})
+    options = {
+        'xlabel': 'x', 'ylabel': 'y', 'xunit': 'a.u.', 'title': 'Title',
+        'legend': True, 'labels': [f'label {i}' for i in range(size)], 'markers': [None, 'o'], 'palettes': [('qualitative', 'Set1_9')],
+        'backgrounds': [{'xlim': [i/size, (i+0.5)/size]} for i in range(size)],
+        'text': [[f'text {i}', (i/size, 0.5)] for i in range(size)],
+        'x_tick_locators': [0.5, 0.1], 'y_tick_locators': [0.5, 0.1],
+    }
+    yield
+
+    plots.adjust_plot(fig, ax, options)
+    plt.close(fig)
+
+
+def bench_adjust_grid(size, tmp):
+    fig, axes = plots.prepare_plot({'format_params': {'dpi': 100, 'nrows': size, 'ncols': size}})
+    options = {
+        'xlabel': 'x', 'ylabel': 'y', 'legend': True, 'labels': ['a', 'b'], 'markers': [None], 'palettes': [('qualitative', 'Set1_9')],
+        'x_tick_locators': [0.5, 0.1], 'y_tick_locators': [0.5, 0.1], 'sharex': 'col', 'sharey': 'row',
+    }
+    yield
+
+    plots.adjust_grid(fig, axes, options)
+    plt.close(fig)
+
+
+def bench_prepare_inset_axes(size, tmp):
+    fig, ax = plots.prepare_plot({'format_params': {'dpi': 100}})
+    yield
+
+    for i in range(size):
+        plots.prepare_inset_axes(ax, {'inset_position': [0.1, 0.1, 0.3, 0.3]})
+
+    plt.close(fig)
+
+
+def bench_plot_many(size, tmp):
+    fig, ax = plots.prepare_plot({'format_params': {'dpi': 100}})
+    Y = np.random.default_rng(0).random((size, 1000)).cumsum(axis=1)
+    yield
+
+    plots.plot_many(ax, None, Y, {'palettes': [('qualitative', 'Set1_9')]})
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def bench_draft(size, tmp):
+    fig, ax = plots.prepare_plot({'format_params': {'dpi': 600}, 'draft': True})
+    x = np.linspace(0, 1, size)
+    y = np.random.default_rng(0).random(size).cumsum()
+    yield
+
+    ax.plot(x, y)
+    plots.adjust_plot(fig, ax, {'xlabel': 'x', 'ylabel': 'y'})
+    fig.savefig(os.path.join(tmp, 'draft.png'))
+    fig.close()
+
+
+def bench_mix_colours(size, tmp):
+    yield
+    colours.mix_colours((1, 0, 0), (0, 0, 1), {'number_of_colours': size})
+
+
+def bench_generate_colours(size, tmp):
+    yield
+
+    for i in range(size):
+        colour_cycle = colours.generate_colours([('qualitative', 'Set1_9'), ('sequential', 'Blues_9')])
+        next(colour_cycle)
+
+
+def bench_make_animation(size, tmp):
+    frames = []
+    for i in range(size):
+        frame = np.zeros((100, 100, 3), dtype=np.uint8)
+        frame[:, i % 100] = (255, 0, 0)
+        frames.append(os.path.join(tmp, f'frame_{i}.png'))
+        Image.fromarray(frame).save(frames[-1])
+
+    yield
+
+    animations.make_animation(frames, {'save_folder': tmp, 'save_filename': 'animation.gif', 'fps': 10})
+
+
+def bench_make_animation_optimised(size, tmp):
+    frames = []
+    for i in range(size):
+        frame = np.zeros((100, 100, 3), dtype=np.uint8)
+        frame[:, i % 100] = (255, 0, 0)
+        frames.append(Image.fromarray(frame))
+
+    yield
+
+    animations.make_animation(iter(frames), {'save_folder': tmp, 'save_filename': 'animation.gif', 'fps': 10, 'gif_optimise': True})
+
+
+def bench_save_load_options(size, tmp):
+    options = {f'key_{i}': {'values': list(range(10)), 'name': f'name {i}'} for i in range(size)}
+    path = os.path.join(tmp, 'options.json')
+    yield
+
+    aux.save_options(options, path)
+    aux.load_options(path)
+
+
+# Each benchmark is a generator function called with a size and a temporary folder. Everything before the yield is setup and is not measured.
+BENCHMARKS = [
+    {'name': 'prepare_plot', 'func': bench_prepare_plot, 'sizes': [1], 'repeats': 10, 'max_exponent': None},
+    {'name': 'prepare_plot_grid', 'func': bench_prepare_plot_grid, 'sizes': [2, 4, 8], 'repeats': 3, 'max_exponent': 2.5}, # size x size axes
+    {'name': 'adjust_plot', 'func': bench_adjust_plot, 'sizes': [1, 10, 100], 'repeats': 5, 'max_exponent': 1.5}, # number of labels, backgrounds and texts
+    {'name': 'adjust_grid', 'func': bench_adjust_grid, 'sizes': [2, 4, 8], 'repeats': 3, 'max_exponent': 2.5}, # size x size axes
+    {'name': 'prepare_inset_axes', 'func': bench_prepare_inset_axes, 'sizes': [1, 4], 'repeats': 5, 'max_exponent': 1.5}, # number of insets
+    {'name': 'plot_many', 'func': bench_plot_many, 'sizes': [10, 100, 1000], 'repeats': 3, 'max_exponent': 1.5}, # number of series
+    {'name': 'draft', 'func': bench_draft, 'sizes': [10000, 100000, 1000000], 'repeats': 3, 'max_exponent': 1.5}, # number of points
+    {'name': 'mix_colours', 'func': bench_mix_colours, 'sizes': [10, 1000, 100000], 'repeats': 10, 'max_exponent': 1.5}, # number of colours
+    {'name': 'generate_colours', 'func': bench_generate_colours, 'sizes': [10, 1000], 'repeats': 5, 'max_exponent': 1.5}, # number of calls
+    {'name': 'make_animation', 'func': bench_make_animation, 'sizes': [10, 50, 200], 'repeats': 3, 'max_exponent': 1.5}, # number of frames
+    {'name': 'make_animation_optimised', 'func': bench_make_animation_optimised, 'sizes': [10, 50, 200], 'repeats': 3, 'max_exponent': 1.5}, # number of frames
+    {'name': 'save_load_options', 'func': bench_save_load_options, 'sizes': [10, 1000], 'repeats': 5, 'max_exponent': 1.5}, # number of keys
+]
+
+
+def run_benchmark(benchmark, size):
+    ''' Runs a benchmark at size repeats times with tracemalloc off, and returns the fastest wall time in seconds.
+    Tracing slows down allocations, so the peak of memory traced in bytes is taken from one separate run, and returned too.'''
+
+    times = [measure(benchmark, size, trace=False) for i in range(benchmark['repeats'])]
+    peak = measure(benchmark, size, trace=True)
+
+    return min(times), peak
+
+
+def measure(benchmark, size, trace=False):
+    ''' Runs a benchmark at size once. Returns the wall time in seconds, or the peak of memory traced in bytes if trace is True.'''
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        run = benchmark['func'](size, tmp)
+        next(run)
+
+        if trace:
+            tracemalloc.start()
+
+            try:
+                next(run, None)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        start = time.perf_counter()
+
+        next(run, None)
+
+        return time.perf_counter() - start
+
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def scaling_exponent(sizes, times):
+    ''' Returns the exponent k of time ~ size**k between the smallest and largest size'''
+
+    if len(sizes) < 2 or times[0] <= 0:
+        return None
+
+    return math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+
+
+def compare(result, baseline, tolerance):
+    ''' Returns a list of the ways a result is a regression compared to its baseline'''
+
+    regressions = []
+
+    if result['time'] > baseline['time'] * tolerance:
+        regressions.append(f'time {result["time"]/baseline["time"]:.1f}x baseline')
+
+    if result['peak_memory'] > baseline['peak_memory'] * tolerance and result['peak_memory'] - baseline['peak_memory'] > 1024**2:
+        regressions.append(f'memory {result["peak_memory"]/baseline["peak_memory"]:.1f}x baseline')
+
+    return regressions
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths of plotter.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='path to the baseline to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='factor a result may be slower or use more memory than the baseline')
+    parser.add_argument('--filter', default=None, help='only run the benchmarks whose name contain this string')
+    parser.add_argument('--output', default=None, help='path to write the results to as JSON')
+    args = parser.parse_args(args)
+
+    baseline = {}
+    if os.path.isfile(args.baseline) and not args.save_baseline:
+        baseline = aux.load_options(args.baseline)
+
+    results = {}
+    failed = False
+
+    for benchmark in BENCHMARKS:
+        if args.filter and args.filter not in benchmark['name']:
+            continue
+
+        times = []
+
+        for size in benchmark['sizes']:
+            key = f'{benchmark["name"]}[{size}]'
+
+            elapsed, peak = run_benchmark(benchmark, size)
+            results[key] = {'time': elapsed, 'peak_memory': peak}
+            times.append(elapsed)
+
+            regressions = compare(results[key], baseline[key], args.tolerance) if key in baseline.keys() else []
+            failed = failed or bool(regressions)
+
+            print(f'{key:28s} {elapsed*1000:10.2f} ms {peak/1024:12.1f} KiB  ' + ('REGRESSION: ' + ', '.join(regressions) if regressions else 'ok'))
+
+        exponent = scaling_exponent(benchmark['sizes'], times)
+
+        if exponent is not None:
+            results[f'{benchmark["name"]}[exponent]'] = exponent
+
+            if benchmark['max_exponent'] is not None and exponent > benchmark['max_exponent']:
+                failed = True
+                print(f'{benchmark["name"]:28s} scales as size**{exponent:.2f} (max {benchmark["max_exponent"]})  REGRESSION')
+            else:
+                print(f'{benchmark["name"]:28s} scales as size**{exponent:.2f}')
+
+    if args.save_baseline:
+        aux.save_options(results, args.baseline)
+        print(f'Saved baseline to {args.baseline}')
+
+    if args.output:
+        aux.save_options(results, args.output)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+''' A plotting tool written on top of matplotlib to arrive at nice looking plots a little quicker.
+
+The submodules are imported when first accessed (e.g. plotter.plots), and import their heavy dependencies (matplotlib, NumPy, PIL) only when a function that needs them is called.'''
+
+import importlib
+
+__version__ = '0.1'
+
+__all__ = ['animations', 'auxillary', 'batch', 'cache', 'colours', 'decimation', 'density', 'draft', 'insets', 'instrumentation', 'interactive', 'lifecycle', 'plots', 'pool', 'saving', 'server', 'streaming']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,25 +1,307 @@
 import plotter.auxillary as aux
+import plotter.instrumentation as inst
 
-from PIL import Image
 import os
+import collections
+import itertools
+import struct
+
+# Imported the first time they are used (see aux.lazy_import)
+futures = aux.lazy_import('concurrent.futures')
+Image = aux.lazy_import('PIL.Image')
+GifImagePlugin = aux.lazy_import('PIL.GifImagePlugin')
+matplotlib = aux.lazy_import('matplotlib')
+plt = aux.lazy_import('matplotlib.pyplot')
+backend_agg = aux.lazy_import('matplotlib.backends.backend_agg')
+mcolors = aux.lazy_import('matplotlib.colors')
+np = aux.lazy_import('numpy')
 
 
 def make_animation(paths, options={}):
+    ''' Writes an animation from a sequence of frames. paths can be a list or generator of paths to image files and/or PIL.Image-objects already in memory.
+
+    Each frame is opened, encoded and appended exactly once. GIFs are written to file frame by frame, so memory use stays flat regardless of the number of frames.
+    Other formats supported by Pillow (e.g. APNG and WebP) are written through the same options-dictionary - the format is inferred from save_filename unless options['format'] is set. Note that Pillow
+    needs all frames in memory to write these.
+
+    With options['gif_optimise'], GIFs are written with one palette shared by all frames, and only the region that changed from the previous frame is stored (see write_optimised_gif). This is usually
+    many times smaller and faster to encode for plots, where most of the frame stays the same.'''
 
     default_options = {
         'save_folder': '.',
         'save_filename': 'animation.gif',
-        'fps': 5
+        'format': None, # Inferred from the extension of save_filename if None
+        'fps': 5,
+        'loop': 0, # Number of times the animation should loop. 0 loops forever.
+        'gif_optimise': False, # Write GIFs with a shared palette and only the changed region of each frame
+        'gif_colours': None, # Colours known to be in the frames (e.g. of the lines, text and background), which are kept exact in the shared palette
+        'gif_palette_sample': 8, # Number of frames the rest of the shared palette is computed from
     }
 
     options = aux.update_options(options=options, default_options=default_options)
 
+    timer = inst.stages('make_animation', options)
+
+    path = os.path.join(options['save_folder'], options['save_filename'])
+
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    if not options['format']:
+        options['format'] = Image.registered_extensions().get(os.path.splitext(options['save_filename'])[1].lower(), 'GIF')
+
+    duration = (1/options['fps'])*1000
+
+    frames = iterate_frames(paths)
+
+    if options['format'].upper() == 'GIF' and options['gif_optimise']:
+        write_optimised_gif(frames=frames, path=path, duration=duration, loop=options['loop'], colours=options['gif_colours'], sample=options['gif_palette_sample'])
+
+    elif options['format'].upper() == 'GIF':
+        write_gif(frames=frames, path=path, duration=duration, loop=options['loop'])
+
+    else:
+        # Pillow iterates over append_images more than once for some formats (e.g. APNG), so these cannot be passed as a generator
+        frames = list(frames)
+
+        if not frames:
+            raise ValueError('Cannot make an animation without any frames.')
+
+        timer.lap('frames')
+
+        frames[0].save(path, format=options['format'], append_images=frames[1:], save_all=True, duration=duration, loop=options['loop'])
+
+    # For GIFs, the frames are loaded while encoding
+    timer.lap('encode')
+    timer.finish()
+
+
+
+def render_animation(func, frames_data, options={}, workers=None):
+    ''' Renders one frame per element in frames_data by calling func(data=data, options=options), and streams the frames straight to make_animation without writing them to disk.
+
+    func should return the figure (or a tuple starting with the figure, e.g. fig, ax from prepare_plot) and must be importable by the worker processes, i.e. defined at module level.
+    The frames are rendered across a pool of workers processes (defaults to the number of CPUs) into RGBA-buffers, and passed on to the encoder in the order of frames_data. Pass workers=1 to render in the current process.
+    The options-dictionary is passed to func for every frame, and is also used by make_animation.'''
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    frames = (Image.frombuffer('RGBA', size, buffer, 'raw', 'RGBA', 0, 1) for size, buffer in render_frames(func=func, frames_data=frames_data, options=options, workers=workers))
+
+    make_animation(paths=frames, options=options)
+
+
+
+def render_frames(func, frames_data, options={}, workers=1):
+    ''' Yields (size, buffer) of the rendered RGBA-frames in the order of frames_data. At most twice as many frames as there are workers are in flight at any time, to keep memory bounded if encoding is slower than rendering.'''
+
+    if workers == 1:
+        for data in frames_data:
+            yield _render_frame(func, data, options)
+
+        return
+
+
+    with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as executor:
+        pending = collections.deque()
+
+        for data in frames_data:
+            pending.append(executor.submit(_render_frame, func, data, options))
+
+            if len(pending) >= 2*workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+
+def _init_render_worker():
+    matplotlib.use('Agg')
+
+
+def _render_frame(func, data, options):
+
+    fig = func(data=data, options=options)
+
+    if isinstance(fig, (tuple, list)):
+        fig = fig[0]
+
+    canvas = backend_agg.FigureCanvasAgg(fig)
+    canvas.draw()
+
+    size = canvas.get_width_height(physical=True)
+    buffer = bytes(canvas.buffer_rgba())
+
+    plt.close(fig)
+
+    return size, buffer
+
+
+
+def iterate_frames(paths):
+    ''' Yields one PIL.Image at a time from a list or generator of paths and/or images. Frames opened from a path are closed as soon as the next frame is requested.'''
 
-    frames = []
     for path in paths:
-        frame = Image.open(path)
-        frames.append(frame)
+        if isinstance(path, Image.Image):
+            yield path
+
+        else:
+            with Image.open(path) as frame:
+                frame.load()
+                yield frame
+
+
+
+def write_gif(frames, path, duration, loop=0):
+    ''' Streams frames to a GIF-file. The first frame's palette is written as the global colour table, and all subsequent frames are quantised and written with their own local colour table.'''
+
+    frames = iter(frames)
+    first = next(frames, None)
+
+    # Checked before the file is opened, so that an existing file is not overwritten by an empty one
+    if first is None:
+        raise ValueError('Cannot make an animation without any frames.')
+
+    with open(path, 'wb') as f:
+        number_of_frames = 0
+
+        for frame in itertools.chain([first], frames):
+            frame = _to_palette(frame)
+
+            if number_of_frames == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={'loop': loop, 'duration': duration})
+                f.write(b''.join(header))
+
+            for chunk in GifImagePlugin.getdata(frame, duration=duration, include_color_table=number_of_frames > 0):
+                f.write(chunk)
+
+            number_of_frames += 1
+
+        # GIF trailer
+        f.write(b';')
+
+
+
+def write_optimised_gif(frames, path, duration, loop=0, colours=None, sample=8):
+    ''' Streams frames to a GIF-file with a single global palette, and stores only the bounding box of the pixels that changed from the previous frame. Unchanged pixels within the box are made
+    transparent, which compresses well. Consecutive identical frames are merged into one with a longer duration.
+
+    The palette holds colours exactly (matplotlib colour specifications), with the remaining entries computed from the first sample frames. Only these frames are held in memory at a time.'''
+
+    frames = iter(frames)
+    sampled = [frame.convert('RGB') for frame in itertools.islice(frames, sample)]
+
+    if not sampled:
+        raise ValueError('Cannot make an animation without any frames.')
+
+    palette = make_palette(sampled, colours=colours)
+    # The palette image needs all 256 entries, so the transparent entry is set to a copy of the first colour, and pixels mapped to it are moved to the first entry
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette(np.concatenate([palette, palette[:1]]).tobytes())
+
+    with open(path, 'wb') as f:
+        f.write(_gif_header(size=sampled[0].size, palette=palette, loop=loop))
+
+        previous, pending = None, None
+
+        for frame in itertools.chain(sampled, frames):
+            indices = np.asarray(frame.convert('RGB').quantize(palette=palette_image, dither=Image.Dither.NONE)).copy()
+            indices[indices == TRANSPARENT_INDEX] = 0
+
+            if previous is None:
+                offset, crop = (0, 0), indices
+
+            else:
+                changed = indices != previous
+
+                if not changed.any():
+                    pending['duration'] += duration
+                    continue
+
+                rows, columns = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+                top, bottom, left, right = rows[0], rows[-1]+1, columns[0], columns[-1]+1
+
+                offset = (int(left), int(top))
+                crop = np.where(changed[top:bottom, left:right], indices[top:bottom, left:right], TRANSPARENT_INDEX)
+
+            if pending:
+                _write_gif_frame(f, **pending)
+
+            pending = {'indices': crop, 'offset': offset, 'duration': duration, 'transparency': previous is not None}
+            previous = indices
+
+        _write_gif_frame(f, **pending)
+
+        # GIF trailer
+        f.write(b';')
+
+
+
+TRANSPARENT_INDEX = 255 # Palette index reserved for unchanged pixels in optimised GIFs
+
+
+def make_palette(frames, colours=None):
+    ''' Returns a (255, 3) uint8-array with colours first, followed by colours quantised from frames. The last of the 256 palette entries is left for transparency.'''
+
+    known = np.round(mcolors.to_rgba_array(colours)[:, :3] * 255).astype(np.uint8) if colours is not None and len(colours) > 0 else np.zeros((0, 3), dtype=np.uint8)
+    known = np.unique(known, axis=0)[:TRANSPARENT_INDEX]
+
+    pixels = np.concatenate([np.asarray(frame).reshape(-1, 3) for frame in frames])
+
+    # Limit the number of pixels that are quantised, which does not change the palette of a plot much
+    pixels = pixels[::max(len(pixels) // 2**20, 1)]
+
+    quantised = Image.fromarray(pixels[np.newaxis]).quantize(colors=TRANSPARENT_INDEX, method=Image.Quantize.FASTOCTREE)
+    quantised = np.asarray(quantised.getpalette()[:3*TRANSPARENT_INDEX], dtype=np.uint8).reshape(-1, 3)
+
+    # Fill up with the most distinct quantised colours that are not already known
+    quantised = quantised[~(quantised[:, np.newaxis] == known[np.newaxis]).all(axis=-1).any(axis=-1)]
+    quantised = np.unique(quantised, axis=0)[:TRANSPARENT_INDEX - len(known)]
+
+    palette = np.zeros((TRANSPARENT_INDEX, 3), dtype=np.uint8)
+    palette[:len(known)+len(quantised)] = np.concatenate([known, quantised])
+
+    # Unused entries repeat the first colour, so no pixel is mapped to them by mistake
+    palette[len(known)+len(quantised):] = palette[0]
+
+    return palette
+
+
+
+def _gif_header(size, palette, loop):
+    ''' Returns the GIF89a header with palette as the global colour table, followed by the looping extension'''
+
+    palette = np.concatenate([palette, np.zeros((256 - len(palette), 3), dtype=np.uint8)])
+
+    return b''.join([
+        b'GIF89a',
+        struct.pack('<HHBBB', size[0], size[1], 0xF7, 0, 0), # Global colour table with 256 entries, background index 0
+        palette.tobytes(),
+        b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00',
+    ])
+
+
+
+def _write_gif_frame(f, indices, offset, duration, transparency):
+
+    frame = Image.frombytes('P', (indices.shape[1], indices.shape[0]), np.ascontiguousarray(indices, dtype=np.uint8).tobytes())
+
+    # Frames are drawn on top of the previous one (disposal 1), so unchanged regions are kept
+    params = {'duration': duration, 'disposal': 1, 'include_color_table': False}
+
+    if transparency:
+        params['transparency'] = TRANSPARENT_INDEX
+
+    for chunk in GifImagePlugin.getdata(frame, offset=offset, **params):
+        f.write(chunk)
+
+
+
+def _to_palette(frame):
 
-        frames[0].save(os.path.join(options['save_folder'], options['save_filename']), format='GIF', append_images=frames[1:], save_all=True, duration=(1/options['fps'])*1000, loop=0)
+    if frame.mode == 'P':
+        return frame.copy()
 
-    
+    return frame.convert('RGB').convert('P', palette=Image.ADAPTIVE)
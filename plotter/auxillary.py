@@ -1,5 +1,7 @@
 import json
 import os
+import importlib
+import types
 
 def update_options(options, default_options, required_options=None):
     ''' Takes a dictionary of options along with a list of required options and dictionary of default options, and sets all keyval-pairs of options that is not already defined to the default values'''
@@ -42,3 +44,41 @@ def load_options(path):
     return(options)
 
 
+
+
+def freeze(options):
+    ''' Converts a (nested) options-dictionary into a hashable representation that can be used as a key in caches. Lists become tuples, dictionaries become sorted tuples of keyval-pairs, and anything else that is not hashable is represented by its repr.'''
+
+    if isinstance(options, dict):
+        return tuple(sorted((key, freeze(val)) for key, val in options.items()))
+
+    if isinstance(options, (list, tuple)):
+        return tuple(freeze(val) for val in options)
+
+    try:
+        hash(options)
+    except TypeError:
+        return repr(options)
+
+    return options
+
+
+def lazy_import(name):
+    ''' Returns a stand-in for the module name, that imports the module the first time one of its attributes is accessed. Used to keep heavy dependencies (matplotlib, NumPy, PIL) from being imported before they are needed.'''
+
+    return LazyModule(name)
+
+
+class LazyModule(types.ModuleType):
+    ''' Module stand-in returned by lazy_import'''
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+
+        # Copy the attributes of the module, so that later accesses are found directly rather than through __getattr__. Attributes added to the module afterwards (e.g. submodules imported later) are still found here.
+        self.__dict__.update(module.__dict__)
+
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name__!r}>'
@@ -0,0 +1,127 @@
+import plotter.auxillary as aux
+import plotter.plots as plots
+import plotter.instrumentation as inst
+
+import os
+import time
+import traceback
+
+# Imported the first time they are used (see aux.lazy_import)
+futures = aux.lazy_import('concurrent.futures')
+matplotlib = aux.lazy_import('matplotlib')
+plt = aux.lazy_import('matplotlib.pyplot')
+
+
+def render_batch(func, manifest, options={}, workers=None):
+    ''' Renders a batch of figures across a pool of worker processes. Each job in the manifest is run through prepare_plot -> func -> adjust_plot -> savefig.
+
+    manifest is a list of jobs, or a path to a JSON-file containing such a list. Each job is a dictionary with the keys:
+        'data': the data to plot, or a data source (e.g. a path) if options['load_func'] is passed
+        'options': an options-dictionary, or a path to one saved with aux.save_options
+        'output': the path the figure should be saved to
+
+    func is called as func(fig=fig, ax=ax, data=data, options=options) and should draw the data onto ax. It must be importable by the worker processes, i.e. defined at module level.
+
+    Failing jobs do not stop the batch - the error is reported in the returned list of results, which has one dictionary per job in the order of the manifest.'''
+
+    default_options = {
+        'load_func': None, # Called as load_func(data) in the worker to load the data source of each job
+        'progress_func': None, # Called as progress_func(done, total, result) every time a job finishes
+        'savefig_kwargs': {}, # Keyword arguments passed on to fig.savefig()
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    if isinstance(manifest, str):
+        manifest = aux.load_options(manifest)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    results = [None for job in manifest]
+
+    if workers == 1:
+        for i, job in enumerate(manifest):
+            results[i] = render_job(func=func, job=job, load_func=options['load_func'], savefig_kwargs=options['savefig_kwargs'])
+            if options['progress_func']:
+                options['progress_func'](i+1, len(results), results[i])
+
+        return results
+
+
+    with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        jobs = {executor.submit(render_job, func, job, options['load_func'], options['savefig_kwargs']): i for i, job in enumerate(manifest)}
+
+        for done, future in enumerate(futures.as_completed(jobs)):
+            i = jobs[future]
+
+            try:
+                results[i] = future.result()
+            except Exception:
+                # E.g. a worker process that died, or a result that could not be pickled
+                results[i] = {'output': manifest[i]['output'], 'status': 'failed', 'error': traceback.format_exc(), 'time': None}
+
+            if options['progress_func']:
+                options['progress_func'](done+1, len(results), results[i])
+
+    return results
+
+
+
+def render_job(func, job, load_func=None, savefig_kwargs={}):
+    ''' Renders and saves a single figure from a job in a manifest (see render_batch). Exceptions are caught and returned in the result rather than raised.'''
+
+    start = time.perf_counter()
+    fig = None
+
+    try:
+        options = job['options'] if 'options' in job.keys() and job['options'] else {}
+
+        if isinstance(options, str):
+            options = aux.load_options(options)
+        else:
+            options = options.copy()
+
+        data = load_func(job['data']) if load_func else job['data']
+
+        with plots.style_context(options):
+            fig, ax = plots.prepare_plot(options=options)
+
+            with inst.stage('plot', options):
+                func(fig=fig, ax=ax, data=data, options=options)
+
+            # Grids are adjusted by func, as adjust_plot only handles a single Axes-object
+            if not hasattr(ax, 'shape'):
+                plots.adjust_plot(fig=fig, ax=ax, options=options)
+
+            if os.path.dirname(job['output']) and not os.path.isdir(os.path.dirname(job['output'])):
+                os.makedirs(os.path.dirname(job['output']), exist_ok=True)
+
+            with inst.stage('savefig', options):
+                fig.savefig(job['output'], **savefig_kwargs)
+
+        result = {'output': job['output'], 'status': 'ok', 'error': None}
+
+    except Exception:
+        result = {'output': job['output'] if 'output' in job.keys() else None, 'status': 'failed', 'error': traceback.format_exc()}
+
+    finally:
+        if fig is not None:
+            plt.close(fig)
+
+    result['time'] = time.perf_counter() - start
+
+    return result
+
+
+
+def _init_batch_worker():
+    ''' Sets up each worker process once, so that all jobs it renders share a warm matplotlib state (backend, font cache and compiled styles).'''
+
+    matplotlib.use('Agg')
+
+    # Trigger loading of the font cache before the first job
+    fig, ax = plots.prepare_plot()
+    fig.canvas.draw()
+    plt.close(fig)
+
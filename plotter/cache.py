@@ -0,0 +1,234 @@
+import plotter
+import plotter.auxillary as aux
+import plotter.plots as plots
+
+import contextlib
+import copy
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows, where eviction is then not locked between processes
+    fcntl = None
+
+# Imported the first time they are used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+matplotlib = aux.lazy_import('matplotlib')
+
+
+def cached_render(render_func, data, options, path, cache_options={}):
+    ''' Renders a figure through render_func(data=data, options=options, path=path), unless a figure has already been rendered from the same data and options, in which case the saved output is copied to path instead.
+
+    The cache key is a hash of render_func (its module, name and code), the data (e.g. NumPy-arrays, pandas-objects, lists and dictionaries of these), the options after the defaults of prepare_plot and adjust_plot are applied,
+    the file extension of path and the versions of plotter and matplotlib. Data or options that can not be hashed the same way in every process raise a TypeError.
+    The outputs are kept in cache_options['cache_folder'], which is limited to cache_options['max_bytes'] by deleting the least recently used outputs. The cache can be shared by several processes.
+
+    Returns a dictionary with the key and whether it was a hit.'''
+
+    default_cache_options = {
+        'cache_folder': os.environ.get('PLOTTER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'plotter')),
+        'max_bytes': 1024**3,
+    }
+
+    cache_options = aux.update_options(options=cache_options, default_options=default_cache_options)
+
+    key = cache_key(data=data, options=options, extension=os.path.splitext(path)[1], render_func=render_func)
+    entry = os.path.join(cache_options['cache_folder'], key + os.path.splitext(path)[1])
+
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    try:
+        _atomic_copy(entry, path)
+    except FileNotFoundError:
+        hit = False
+    else:
+        hit = True
+
+    if hit:
+        # Mark as recently used
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            pass
+
+        return {'key': key, 'hit': True}
+
+    render_func(data=data, options=options, path=path)
+
+    os.makedirs(cache_options['cache_folder'], exist_ok=True)
+    _atomic_copy(path, entry)
+
+    evict(cache_folder=cache_options['cache_folder'], max_bytes=cache_options['max_bytes'])
+
+    return {'key': key, 'hit': False}
+
+
+
+def cache_key(data, options, extension='', render_func=None):
+    ''' Returns a hex digest identifying the output of render_func rendered from data and options'''
+
+    digest = hashlib.blake2b(digest_size=20)
+
+    _update_hash(digest, render_func)
+    _update_hash(digest, data)
+    _update_hash(digest, resolve_options(options))
+    _update_hash(digest, [extension, plotter.__version__, matplotlib.__version__])
+
+    return digest.hexdigest()
+
+
+
+def resolve_options(options):
+    ''' Returns a copy of options with the defaults of prepare_plot (format_params) and adjust_plot applied, so that options that only differ in whether defaults are set explicitly give the same key'''
+
+    resolved = copy.copy(options)
+    resolved['format_params'] = plots.compile_style(options).format_params
+
+    return aux.update_options(options=resolved, default_options=plots.get_default_adjust_options())
+
+
+
+def evict(cache_folder, max_bytes):
+    ''' Deletes the least recently used outputs in cache_folder until their total size is below max_bytes'''
+
+    with _lock(cache_folder):
+        entries = []
+
+        for entry in os.scandir(cache_folder):
+            if entry.is_file() and not entry.name.startswith('.'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for mtime, size, path in entries)
+
+        for mtime, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+
+
+def clear_cache(cache_folder):
+    ''' Deletes all outputs in cache_folder'''
+
+    evict(cache_folder=cache_folder, max_bytes=0)
+
+
+
+def _atomic_copy(source, destination):
+    ''' Copies source to destination through a temporary file, so that other processes never see a partially written file'''
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destination) or '.', prefix='.tmp-')
+    os.close(fd)
+
+    try:
+        shutil.copyfile(source, tmp)
+
+        # mkstemp makes the file readable by the owner only, whereas a file made with open() follows the umask
+        os.chmod(tmp, 0o666 & ~_get_umask())
+        os.replace(tmp, destination)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+
+@functools.lru_cache(maxsize=None)
+def _get_umask():
+    ''' Returns the umask of the process. It can only be read by setting it, so this is done once and cached.'''
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+
+    return umask
+
+
+
+@contextlib.contextmanager
+def _lock(cache_folder):
+    ''' Exclusive lock on the cache folder, held while evicting'''
+
+    with open(os.path.join(cache_folder, '.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+
+def _update_hash(digest, obj):
+
+    if isinstance(obj, dict):
+        digest.update(b'dict')
+        for key in sorted(obj.keys(), key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, obj[key])
+
+    elif isinstance(obj, (list, tuple)):
+        # Lists and tuples are hashed alike, as tuples become lists when options are saved to and loaded from JSON
+        digest.update(b'sequence')
+        for val in obj:
+            _update_hash(digest, val)
+
+    elif isinstance(obj, (set, frozenset)):
+        # Sets have no order of their own (and the order of strings changes between processes with hash randomisation), so they are sorted
+        digest.update(b'set')
+        for val in sorted(obj, key=repr):
+            _update_hash(digest, val)
+
+    elif isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        digest.update(f'{type(obj).__name__}:{obj!r};'.encode())
+
+    elif isinstance(obj, functools.partial):
+        digest.update(b'partial')
+        _update_hash(digest, [obj.func, obj.args, obj.keywords])
+
+    elif callable(obj) and hasattr(obj, '__qualname__'):
+        # Functions (and classes) by where they are defined, and functions also by their code, so that e.g. two lambdas in the same module differ
+        digest.update(f'callable:{getattr(obj, "__module__", None)}.{obj.__qualname__};'.encode())
+
+        code = getattr(getattr(obj, '__func__', obj), '__code__', None)
+        if code is not None:
+            digest.update(code.co_code)
+            _update_hash(digest, [const for const in code.co_consts if not hasattr(const, 'co_code')])
+
+    elif hasattr(obj, '__array__'):
+        # Labelled arrays (e.g. pandas DataFrames and Series) are also identified by their index, column names and name
+        for attr in ('index', 'columns'):
+            if hasattr(getattr(obj, attr, None), '__array__'):
+                digest.update(f'{attr}:'.encode())
+                _update_hash(digest, getattr(obj, attr))
+
+        if isinstance(getattr(obj, 'name', None), (str, int, float)):
+            _update_hash(digest, obj.name)
+
+        array = np.asarray(obj)
+
+        if array.dtype.hasobject:
+            _update_hash(digest, array.tolist())
+        else:
+            digest.update(f'array:{array.dtype.str}:{array.shape};'.encode())
+            digest.update(np.ascontiguousarray(array).reshape(-1).view(np.uint8) if array.size else b'')
+
+    else:
+        # The repr of other objects is not stable between processes (e.g. it contains the memory address), so they would never give a hit
+        raise TypeError(f'Can not make a cache key from an object of type {type(obj).__name__}. Pass data and options as NumPy-arrays, pandas-objects, lists, dictionaries, numbers, strings or functions.')
@@ -1,31 +1,48 @@
 import plotter.auxillary as aux
 
-import numpy as np
-
+import functools
 import importlib
 import itertools
 
+# Imported the first time they are used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+matplotlib = aux.lazy_import('matplotlib')
+mcolors = aux.lazy_import('matplotlib.colors')
+
 def generate_colours(palettes, kind=None):
 
     if kind == 'single':
         colour_cycle = itertools.cycle(palettes)
 
     else:
-        # Creates a list of all the colours that is passed in the colour_cycles argument. Then makes cyclic iterables of these. 
-        colour_collection = []
-        for palette in palettes:
-            mod = importlib.import_module("palettable.colorbrewer.%s" % palette[0])
-            colour = getattr(mod, palette[1]).mpl_colors
-            colour_collection = colour_collection + colour
-
-        colour_cycle = itertools.cycle(colour_collection)
+        # Creates a list of all the colours that is passed in the colour_cycles argument. Then makes cyclic iterables of these.
+        colour_cycle = itertools.cycle(get_colour_collection(tuple(tuple(palette) for palette in palettes)))
 
 
     return colour_cycle
 
 
 
+@functools.lru_cache(maxsize=None)
+def get_palette(family, name):
+    ''' Returns the colours of the palettable.colorbrewer palette name in family (e.g. 'qualitative', 'Set1_9') as a tuple. Palettes are resolved once per process and then cached.'''
+
+    mod = importlib.import_module("palettable.colorbrewer.%s" % family)
+
+    return tuple(tuple(colour) for colour in getattr(mod, name).mpl_colors)
+
+
+
+@functools.lru_cache(maxsize=128)
+def get_colour_collection(palettes):
+    ''' Returns the colours of all palettes, passed as a tuple of (family, name)-tuples, concatenated into a single tuple'''
+
+    return tuple(colour for palette in palettes for colour in get_palette(palette[0], palette[1]))
+
+
+
 def mix_colours(colour1, colour2, options):
+    ''' Mixes colour1 and colour2 with options['weights'] (defaults to options['number_of_colours'] evenly spaced weights from 0). Returns an (N, 3) or (N, 4) array, depending on whether the colours are RGB or RGBA.'''
 
     default_options = {
         'number_of_colours': 10,
@@ -34,17 +51,64 @@ def mix_colours(colour1, colour2, options):
 
     options = aux.update_options(options=options, default_options=default_options)
 
-    if not options['weights']:
+    if options['weights'] is None or len(options['weights']) == 0:
         options['weights'] = [x/options['number_of_colours'] for x in range(options['number_of_colours'])]
 
-    colours = []
-    for weight in options['weights']:
-        colour = []
+    weights = np.asarray(options['weights'], dtype=float)[:, np.newaxis]
+
+    colours = np.round((1-weights)*np.asarray(colour1, dtype=float) + weights*np.asarray(colour2, dtype=float), 5)
+
+
+    return colours
+
+
+
+def make_gradient(colours, options={}):
+    ''' Makes a gradient through any number of colours (stops). Returns an (N, 3) or (N, 4) array, depending on whether the colours are RGB or RGBA.
 
-        for c1, c2 in zip(colour1, colour2):
-            colour.append(np.round(((1-weight)*c1 + weight*c2), 5))
+    The stops are placed at options['positions'] (between 0 and 1, defaults to evenly spaced), and the gradient is sampled at options['weights'] (defaults to options['number_of_colours'] evenly spaced weights from 0 to 1).'''
 
-        colours.append(colour)
+    default_options = {
+        'number_of_colours': 10,
+        'weights': None,
+        'positions': None
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    colours = np.asarray(colours, dtype=float)
+
+    positions = np.linspace(0, 1, len(colours)) if options['positions'] is None else np.asarray(options['positions'], dtype=float)
+    weights = np.linspace(0, 1, options['number_of_colours']) if options['weights'] is None else np.asarray(options['weights'], dtype=float)
+
+    # A single stop has no pair to mix between, and gives a constant gradient
+    if len(colours) == 1:
+        return np.round(np.repeat(colours, len(weights), axis=0), 5)
+
+    # Find the pair of stops each weight falls between, and mix these
+    upper = np.clip(np.searchsorted(positions, weights, side='right'), 1, len(positions)-1)
+    lower = upper - 1
+
+    fractions = np.clip((weights - positions[lower]) / (positions[upper] - positions[lower]), 0, 1)[:, np.newaxis]
+
+    gradient = np.round((1-fractions)*colours[lower] + fractions*colours[upper], 5)
+
+
+    return gradient
+
+
+
+def get_colour_array(number_of_colours, colours=None, palettes=None):
+    ''' Returns the first number_of_colours colours of the cycle that generate_colours makes from colours (if passed) or palettes, as an (N, 4) RGBA-array.
+    If neither are passed, the colours of matplotlib's property cycle are used.'''
+
+    if colours is not None and len(colours) > 0:
+        collection = colours
+    elif palettes:
+        collection = get_colour_collection(tuple(tuple(palette) for palette in palettes))
+    else:
+        collection = matplotlib.rcParams['axes.prop_cycle'].by_key().get('color', ['k'])
 
+    collection = mcolors.to_rgba_array(collection)
 
-    return colours
\ No newline at end of file
+    return collection[np.arange(number_of_colours) % len(collection)]
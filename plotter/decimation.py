@@ -0,0 +1,161 @@
+import plotter.auxillary as aux
+import plotter.draft as draft
+
+# Imported the first time it is used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+
+
+@draft.recordable
+def plot(ax, x, y, options={}, **kwargs):
+    ''' Plots a line on ax like ax.plot(x, y, **kwargs), but reduces the data to the resolution of the Axes-object first (see decimate). Returns the list of Line2D-objects from ax.plot.'''
+
+    x, y = decimate(ax=ax, x=x, y=y, options=options)
+
+    return ax.plot(x, y, **kwargs)
+
+
+
+def decimate(ax, x, y, options={}):
+    ''' Reduces line data to what can be resolved on ax, based on the width of the Axes-object in pixels, i.e. the width and dpi set by prepare_plot's format_params.
+
+    Decimation is opt-in, and is only done if options['decimation'] is set to 'minmax' or 'lttb':
+        'minmax': keeps the minimum and maximum of every pixel column, so that all peaks are preserved. x has to be sorted.
+        'lttb': Largest-Triangle-Three-Buckets, which keeps the visual shape of the line with a fixed number of points.
+
+    If x is None, the index of y is used. Returns the (possibly) reduced x and y.'''
+
+    default_options = {
+        'decimation': None, # None, 'minmax' or 'lttb'
+        'decimation_points_per_pixel': 1, # Number of pixel columns (minmax) or points (lttb) per horizontal pixel
+        'decimation_threshold': None, # Only decimate if there are more points than this. Defaults to twice the number of points after decimation.
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    y = np.asarray(y)
+    x = np.arange(len(y)) if x is None else np.asarray(x)
+
+    if not options['decimation']:
+        return x, y
+
+    n_pixels = int(np.ceil(axes_pixel_width(ax) * options['decimation_points_per_pixel']))
+
+    threshold = options['decimation_threshold'] if options['decimation_threshold'] else 2*n_pixels
+
+    if len(x) <= threshold:
+        return x, y
+
+    if options['decimation'] == 'minmax':
+        return minmax(x, y, n_bins=n_pixels, xlim=ax.get_xlim() if not ax.get_autoscalex_on() else None)
+
+    elif options['decimation'] == 'lttb':
+        return lttb(x, y, n_out=n_pixels)
+
+    else:
+        raise ValueError(f'Unknown decimation method {options["decimation"]}. Use "minmax" or "lttb".')
+
+
+
+def axes_pixel_width(ax):
+    ''' Returns the width of the Axes-object in pixels at the resolution (dpi) of its figure'''
+
+    fig = ax.get_figure()
+
+    return ax.get_position().width * fig.get_figwidth() * fig.dpi
+
+
+
+def axes_pixel_height(ax):
+    ''' Returns the height of the Axes-object in pixels at the resolution (dpi) of its figure'''
+
+    fig = ax.get_figure()
+
+    return ax.get_position().height * fig.get_figheight() * fig.dpi
+
+
+
+def minmax(x, y, n_bins, xlim=None):
+    ''' Splits the x-range (or xlim, if passed) into n_bins equally wide columns, and keeps the first point, the minimum, the maximum and the last point of every column, in the order they appear. x has to be sorted in ascending order.
+
+    Points outside xlim are dropped, except the nearest point on either side so that lines still continue out of the Axes. Every column that contains a NaN keeps one, so that gaps in the line stay gaps.'''
+
+    if len(x) == 0:
+        return x, y
+
+    if xlim is not None:
+        start = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+        stop = min(np.searchsorted(x, xlim[1], side='right') + 1, len(x))
+        x, y = x[start:stop], y[start:stop]
+        left, right = xlim
+    else:
+        left, right = x[0], x[-1]
+
+    if right <= left:
+        return x, y
+
+    # Index of the first point in each pixel column. Empty columns give repeated starts, which are removed.
+    edges = np.linspace(left, right, n_bins+1)[1:-1]
+    starts = np.unique(np.concatenate(([0], np.searchsorted(x, edges, side='left'))))
+    starts = starts[starts < len(x)]
+
+    counts = np.diff(np.append(starts, len(x)))
+
+    # The minimum and maximum ignore NaN, so that the peaks next to a gap are kept
+    mins = _first_in_bin(y == np.repeat(np.fmin.reduceat(y, starts), counts), starts)
+    maxs = _first_in_bin(y == np.repeat(np.fmax.reduceat(y, starts), counts), starts)
+    lasts = np.append(starts[1:], len(x)) - 1
+
+    # The first NaN of every column that contains one is kept too, so that gaps in the line are not bridged
+    nans = _first_in_bin(np.isnan(y), starts) if np.issubdtype(y.dtype, np.floating) else np.zeros(0, dtype=int)
+
+    keep = np.unique(np.concatenate((starts, mins, maxs, lasts, nans)))
+
+    return x[keep], y[keep]
+
+
+
+def lttb(x, y, n_out):
+    ''' Largest-Triangle-Three-Buckets downsampling of (x, y) to n_out points. The first and last points are always kept.
+
+    Each bucket depends on the point selected in the previous one, so the buckets are looped over, but the areas within each bucket are computed with NumPy.'''
+
+    n = len(x)
+
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Bucket boundaries for the n - 2 points between the first and the last
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+
+    # The average point of every bucket, used as the third corner of the triangle for the preceding bucket
+    sums_x = np.add.reduceat(x[1:-1].astype(float), edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:-1].astype(float), edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i+1]
+
+        area = np.abs((x[a] - avg_x[i+1]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y[i+1] - y[a]))
+
+        a = start + np.argmax(area)
+        keep[i+1] = a
+
+    return x[keep], y[keep]
+
+
+
+def _first_in_bin(mask, starts):
+    ''' Returns the index of the first True element of mask within each bin, where starts is the index of the first element of every bin'''
+
+    indices = np.flatnonzero(mask)
+    _, first = np.unique(np.searchsorted(starts, indices, side='right'), return_index=True)
+
+    return indices[first]
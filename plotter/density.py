@@ -0,0 +1,110 @@
+import plotter.auxillary as aux
+import plotter.colours as col
+import plotter.decimation as decimation
+import plotter.draft as draft
+import plotter.instrumentation as inst
+import plotter.streaming as streaming
+
+# Imported the first time they are used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+mcolors = aux.lazy_import('matplotlib.colors')
+
+
+@draft.recordable
+def scatter(ax, x, y, values=None, options={}, **kwargs):
+    ''' Draws a scatter plot of any number of points as a single rasterised image at the resolution of the Axes-object (its size and dpi from prepare_plot's format_params). Axes, labels and legends stay vector graphics when saved to PDF or SVG,
+    and the time to draw and the size of the saved file no longer depend on the number of points.
+
+    The points are binned into a grid with options['bins_per_pixel'] bins per pixel, and every bin is coloured by options['reduction']:
+        'count': the number of points in the bin
+        'mean': the mean of values of the points in the bin
+        'sum': the sum of values of the points in the bin
+    Bins without points are left transparent.
+
+    Any keyword arguments are passed on to ax.imshow. Returns the AxesImage, which can be passed to fig.colorbar.'''
+
+    default_options = {
+        'reduction': 'count', # 'count', 'mean' or 'sum'
+        'bins_per_pixel': 1, # Number of bins along each axis per pixel
+        'xlim': None, 'ylim': None, # Range to bin. Defaults to the limits of ax if these are set, otherwise to the range of the data.
+        'colours': None, 'palettes': None, # Colours to make a gradient through, or palettes to take them from (see get_colourmap). Defaults to options['cmap'].
+        'cmap': 'viridis',
+        'norm': 'linear', # Normalisation of the binned values, e.g. 'linear' or 'log'
+        'vmin': None, 'vmax': None,
+        'zorder': 1,
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    if options['reduction'] not in ('count', 'mean', 'sum'):
+        raise ValueError(f'Unknown reduction {options["reduction"]}. Use "count", "mean" or "sum".')
+
+    if options['reduction'] != 'count' and values is None:
+        raise ValueError(f'The reduction {options["reduction"]} requires values.')
+
+    timer = inst.stages('density.scatter', options)
+
+    x, y = np.asarray(x, dtype=float).ravel(), np.asarray(y, dtype=float).ravel()
+
+    if values is not None:
+        values = np.asarray(values, dtype=float).ravel()
+
+        finite = np.isfinite(values)
+        if not finite.all():
+            x, y, values = x[finite], y[finite], values[finite]
+
+    grid, xlim, ylim = bin_grid(ax=ax, x=x, y=y, values=values, options=options)
+
+    timer.lap('bin')
+
+    cmap = get_colourmap(colours=options['colours'], palettes=options['palettes']) if (options['colours'] is not None and len(options['colours']) > 0) or options['palettes'] else options['cmap']
+
+    image = ax.imshow(grid, extent=(xlim[0], xlim[1], ylim[0], ylim[1]), origin='lower', aspect='auto', interpolation='nearest', cmap=cmap, norm=options['norm'], vmin=options['vmin'], vmax=options['vmax'], zorder=options['zorder'], **kwargs)
+
+    timer.lap('draw')
+    timer.finish()
+
+    return image
+
+
+
+def bin_grid(ax, x, y, values=None, options={}):
+    ''' Bins the points (x, y) into a grid with options['bins_per_pixel'] bins per pixel of ax, and reduces each bin as described in scatter. Empty bins are masked.
+
+    Returns the grid as a masked (rows, columns)-array with the lowest y-values in the first row, and its x- and y-limits.'''
+
+    default_options = {
+        'reduction': 'count',
+        'bins_per_pixel': 1,
+        'xlim': None, 'ylim': None,
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    shape = (max(int(np.ceil(decimation.axes_pixel_height(ax) * options['bins_per_pixel'])), 1), max(int(np.ceil(decimation.axes_pixel_width(ax) * options['bins_per_pixel'])), 1))
+
+    xlim, ylim = streaming.get_axes_limits(ax, {'x': x, 'y': y}, aux.update_options(options=dict(options), default_options=streaming.get_default_streaming_options()))
+
+    counts = streaming.bin_points(x, y, xlim=xlim, ylim=ylim, shape=shape)
+
+    if options['reduction'] == 'count':
+        grid = counts.astype(float)
+    else:
+        grid = streaming.bin_points(x, y, xlim=xlim, ylim=ylim, shape=shape, weights=values)
+
+        if options['reduction'] == 'mean':
+            grid = np.divide(grid, counts, out=np.zeros_like(grid), where=counts > 0)
+
+    return np.ma.masked_array(grid.reshape(shape), mask=(counts == 0).reshape(shape)), xlim, ylim
+
+
+
+def get_colourmap(colours=None, palettes=None, number_of_colours=256):
+    ''' Returns a matplotlib colourmap with a gradient through colours, or through the colours of palettes (see colours.generate_colours) if colours is not passed'''
+
+    if colours is None or len(colours) == 0:
+        colours = col.get_colour_collection(tuple(tuple(palette) for palette in palettes))
+
+    gradient = col.make_gradient(mcolors.to_rgba_array(colours), {'number_of_colours': number_of_colours})
+
+    return mcolors.ListedColormap(gradient)
@@ -0,0 +1,486 @@
+''' A draft mode for iterating on figures. prepare_plot(options) with options['draft'] set to True returns a figure that is drawn at screen resolution, with cheaper text rendering and large data reduced,
+and that records every plotting call made on it. Once the figure looks right, finalise replays the calls on a figure at the full dpi and upscaling_factor of options['format_params'] and saves it:
+
+    fig, ax = plots.prepare_plot({**options, 'draft': True})
+    ax.plot(x, y)
+    plots.adjust_plot(fig, ax, options)
+    fig.savefig('preview.png')
+    ...
+    fig.finalise('figure.png')
+
+The draft has the same size in inches as the final figure, so the layout is the same, only with fewer pixels. The final figure is made from the original (full) data.
+
+Calls are recorded when they are made on the draft Figure- and Axes-objects (and on any artists, axes, transforms etc. these return), or when the draft objects are passed to plotter's plotting functions (see recordable).
+Data passed to recorded calls is not copied, and must not be changed before finalise. Calls through pyplot (e.g. plt.xlabel) are not recorded.'''
+
+import plotter.auxillary as aux
+import plotter.instrumentation as inst
+
+import copy
+import functools
+
+# Imported the first time they are used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+mfigure = aux.lazy_import('matplotlib.figure')
+maxes = aux.lazy_import('matplotlib.axes')
+decimation = aux.lazy_import('plotter.decimation')
+lifecycle = aux.lazy_import('plotter.lifecycle')
+plots = aux.lazy_import('plotter.plots')
+
+
+# Methods that only draw or show the draft, and are not replayed by finalise
+UNRECORDED = ('savefig', 'show', 'draw', 'draw_idle', 'draw_artist', 'flush_events', 'print_figure')
+
+
+def get_default_draft_options():
+    ''' Returns the default options of the draft mode'''
+
+    default_options = {
+        'draft_dpi': 100, # Resolution of the draft, in pixels per inch of the figure before upscaling (see format_params['upscaling_factor'])
+        'draft_rc_params': {'text.usetex': False, 'path.simplify': True, 'path.simplify_threshold': 1.0, 'agg.path.chunksize': 10000}, # rcParams used for the draft on top of options['rc_params'], for cheaper text and path rendering
+        'draft_decimation': 'minmax', # How lines drawn with ax.plot are reduced to the resolution of the draft (see decimation.decimate). None to draw all points.
+        'draft_max_points': 20000, # Maximum number of points drawn by each ax.scatter in the draft. None to draw all points.
+    }
+
+    return default_options
+
+
+
+def prepare_draft(options={}):
+    ''' Makes a draft figure as prepare_plot(options) would, but at options['draft_dpi'], and returns fig, ax (or fig, axes for grids) that record all plotting calls for finalise.
+    The resolved format_params of the final figure are written back to options['format_params'], as in prepare_plot.'''
+
+    draft_options = aux.update_options(options=dict(options), default_options=get_default_draft_options())
+
+    # The final figure is made from a copy of the options as passed, as prepare_plot resolves format_params in place
+    final_options = copy.deepcopy({key: value for key, value in options.items() if key not in get_default_draft_options().keys() and key != 'draft'})
+
+    final_format_params = plots.compile_style(final_options).format_params
+
+    format_params = dict(final_options.get('format_params') or {})
+    format_params['dpi'] = min(draft_options['draft_dpi'] / final_format_params['upscaling_factor'], final_format_params['dpi'])
+
+    rc_params = dict(final_options.get('rc_params') or {})
+    rc_params.update(draft_options['draft_rc_params'])
+
+    fig, axes = plots.prepare_plot({**final_options, 'format_params': format_params, 'rc_params': rc_params})
+
+    if 'format_params' in options.keys():
+        options['format_params'].update(copy.deepcopy(final_format_params))
+
+    recording = Recording(fig=fig, axes=axes, final_options=final_options, dpi=final_format_params['dpi'], options=draft_options)
+
+    if isinstance(axes, np.ndarray):
+        draft_axes = np.empty(axes.shape, dtype=object)
+        for i, ax in enumerate(axes.flat):
+            draft_axes.flat[i] = DraftProxy(recording, i+1, ax)
+
+        return DraftFigure(recording, 0, fig), draft_axes
+
+    return DraftFigure(recording, 0, fig), DraftProxy(recording, 1, axes)
+
+
+
+def recordable(func):
+    ''' Decorates a plotting function that takes Axes- or Figure-objects. When called with draft objects, the call is recorded as a whole, and the function runs on the draft objects themselves.
+    It then reduces its data to the resolution of the draft, and runs again with the same arguments on the final figure in finalise.'''
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        recording = _find_recording(args, kwargs)
+
+        if recording is None:
+            return func(*args, **kwargs)
+
+        return recording.call_function(func, args, kwargs)
+
+    return wrapper
+
+
+
+class Recording:
+    ''' The plotting calls made on a draft figure. Every object the calls are made on, or return, has a slot, so that the calls can be replayed on the objects of the final figure.
+    Slot 0 is the figure, followed by its Axes-objects.'''
+
+    def __init__(self, fig, axes, final_options, dpi, options):
+
+        self.final_options = final_options
+        self.dpi = dpi
+        self.options = options
+
+        self.objects = [fig] + _get_axes_list(axes) # Draft objects by slot
+        self.roots = len(self.objects)
+        self.operations = []
+
+
+    def call(self, proxy, name, args, kwargs):
+        ''' Calls method name of the draft object of proxy, and records the call'''
+
+        method = getattr(proxy._target, name)
+
+        if name in UNRECORDED:
+            return method(*_unwrap(args), **_unwrap(kwargs))
+
+        recorded_args, recorded_kwargs = self._record(args), self._record(kwargs)
+        args, kwargs = _unwrap(args), _unwrap(kwargs)
+
+        if isinstance(proxy._target, maxes.Axes) and name in ('plot', 'scatter'):
+            args, kwargs = _reduce(proxy._target, name, args, kwargs, self.options)
+
+        result = method(*args, **kwargs)
+
+        slot = self._add(result)
+        self.operations.append(('call', proxy._slot, name, recorded_args, recorded_kwargs, slot))
+
+        return self._wrap(result, slot)
+
+
+    def call_function(self, func, args, kwargs):
+        ''' Calls a recordable function with the draft objects, and records the call'''
+
+        recorded_args, recorded_kwargs = self._record(args), self._record(kwargs)
+
+        result = func(*_unwrap(args), **_unwrap(kwargs))
+
+        slot = self._add(result)
+        self.operations.append(('function', func, recorded_args, recorded_kwargs, slot))
+
+        return self._wrap(result, slot)
+
+
+    def getattr(self, proxy, name):
+
+        # Functions that reduce data to the resolution of a figure see the resolution of the final figure, so that the data recorded for finalise is the same as without the draft
+        if name == 'dpi' and isinstance(proxy._target, mfigure.Figure):
+            return self.dpi
+
+        value = getattr(proxy._target, name)
+
+        # Methods, and callables standing in for them (e.g. the methods of ax.spines[...])
+        if callable(value) and not _is_matplotlib(value):
+            return functools.partial(_call_method, self, proxy, name)
+
+        if not _is_matplotlib(value):
+            return value
+
+        slot = self._add(value)
+        self.operations.append(('getattr', proxy._slot, name, slot))
+
+        return self._wrap(value, slot)
+
+
+    def setattr(self, proxy, name, value):
+
+        recorded_value = self._record(value)
+
+        setattr(proxy._target, name, _unwrap(value))
+
+        self.operations.append(('setattr', proxy._slot, name, recorded_value))
+
+
+    def getitem(self, proxy, key):
+
+        value = proxy._target[key]
+
+        if not _is_matplotlib(value) and not isinstance(value, (list, tuple)):
+            return value
+
+        slot = self._add(value)
+        self.operations.append(('item', proxy._slot, key, slot))
+
+        return self._wrap(value, slot)
+
+
+    def finalise(self, path, savefig_kwargs={}):
+        ''' Makes the final figure without pyplot, replays all recorded calls on it, saves it to path and closes it. Returns path.'''
+
+        options = copy.deepcopy(self.final_options)
+        options['pyplot'] = False
+
+        timer = inst.stages('finalise', options)
+
+        with plots.style_context(options):
+            fig, axes = plots.prepare_plot(options)
+
+            objects = [fig] + _get_axes_list(axes) + [None] * (len(self.objects) - self.roots)
+
+            timer.lap('prepare')
+
+            try:
+                for operation in self.operations:
+                    _replay(operation, objects)
+
+                timer.lap('replay')
+
+                fig.savefig(path, **savefig_kwargs)
+
+                timer.lap('savefig')
+
+            finally:
+                lifecycle.close_figure(fig)
+
+        timer.finish()
+
+        return path
+
+
+    def _add(self, value):
+
+        self.objects.append(value)
+
+        return len(self.objects) - 1
+
+
+    def _wrap(self, value, slot):
+        ''' Returns value with the matplotlib-objects in it replaced by proxies, so that calls on them are recorded too'''
+
+        if _is_matplotlib(value):
+            return DraftFigure(self, slot, value) if isinstance(value, mfigure.Figure) else DraftProxy(self, slot, value)
+
+        if isinstance(value, (list, tuple)) and any(_is_matplotlib(item) for item in value):
+            return type(value)(self._item(slot, i, item) for i, item in enumerate(value))
+
+        if isinstance(value, np.ndarray) and value.dtype == object and value.size > 0 and _is_matplotlib(value.flat[0]):
+            wrapped = np.empty(value.shape, dtype=object)
+            for index in np.ndindex(value.shape):
+                wrapped[index] = self._item(slot, index, value[index])
+
+            return wrapped
+
+        return value
+
+
+    def _item(self, slot, key, value):
+
+        if not _is_matplotlib(value):
+            return value
+
+        item_slot = self._add(value)
+        self.operations.append(('item', slot, key, item_slot))
+
+        return self._wrap(value, item_slot)
+
+
+    def _record(self, value):
+        ''' Returns value as recorded for finalise: draft objects are replaced by their slots, other matplotlib-objects are copied before they are added to the draft,
+        and lists, tuples and dictionaries (e.g. options) are copied so that later changes to them do not change the recording'''
+
+        def record(value):
+            if isinstance(value, _Proxy):
+                if value._recording is not self:
+                    raise ValueError('Draft objects from different draft figures can not be mixed.')
+
+                return _Slot(value._slot)
+
+            if _is_matplotlib(value):
+                return copy.copy(value)
+
+            return value
+
+        return _map(value, record)
+
+
+
+class _Slot:
+
+    __slots__ = ('slot',)
+
+    def __init__(self, slot):
+        self.slot = slot
+
+
+
+class _Proxy:
+    ''' Stands in for an object of a draft figure, and records the calls made on it'''
+
+    __slots__ = ('_recording', '_slot', '_target')
+
+    def __init__(self, recording, slot, target):
+        object.__setattr__(self, '_recording', recording)
+        object.__setattr__(self, '_slot', slot)
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return self._recording.getattr(self, name)
+
+    def __setattr__(self, name, value):
+        self._recording.setattr(self, name, value)
+
+    def __getitem__(self, key):
+        return self._recording.getitem(self, key)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __iter__(self):
+        for i in range(len(self._target)):
+            yield self[i]
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __eq__(self, other):
+        return self._target is (other._target if isinstance(other, _Proxy) else other)
+
+    def __hash__(self):
+        return id(self._target)
+
+    def __repr__(self):
+        return f'<draft {self._target!r}>'
+
+
+
+class DraftProxy(_Proxy):
+    ''' An Axes-object (or artist, axis, transform etc.) of a draft figure'''
+
+    __slots__ = ()
+
+
+
+class DraftFigure(_Proxy):
+    ''' The Figure-object of a draft figure. Draws like the figure itself (e.g. with savefig), and records all plotting calls for finalise.'''
+
+    __slots__ = ()
+
+    def finalise(self, path, **kwargs):
+        ''' Replays all calls recorded on the draft on a figure at full resolution, and saves it to path. Any keyword arguments are passed on to fig.savefig(). Returns path.
+        Can be called any number of times, also after more calls have been made on the draft.'''
+
+        return self._recording.finalise(path, savefig_kwargs=kwargs)
+
+
+    def close(self):
+        ''' Closes the draft figure (see lifecycle.close_figure). The recording is kept, so the figure can still be finalised.'''
+
+        lifecycle.close_figure(self._target)
+
+
+
+def _get_axes_list(axes):
+    return list(axes.flat) if isinstance(axes, np.ndarray) else [axes]
+
+
+
+def _call_method(recording, proxy, name, *args, **kwargs):
+    return recording.call(proxy, name, args, kwargs)
+
+
+
+def _is_matplotlib(value):
+    return type(value).__module__.split('.')[0] in ('matplotlib', 'mpl_toolkits')
+
+
+
+def _find_recording(args, kwargs):
+
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, _Proxy):
+            return value._recording
+
+        if type(value).__module__ == 'numpy' and getattr(value, 'dtype', None) == object and value.size > 0 and isinstance(value.flat[0], _Proxy):
+            return value.flat[0]._recording
+
+    return None
+
+
+
+def _map(value, func):
+    ''' Applies func to every value within (nested) lists, tuples, dictionaries and arrays of objects (e.g. the Axes-objects of a grid), and returns them in the same structure'''
+
+    if isinstance(value, dict):
+        return {key: _map(item, func) for key, item in value.items()}
+
+    if type(value) in (list, tuple):
+        return type(value)(_map(item, func) for item in value)
+
+    if type(value).__module__ == 'numpy' and getattr(value, 'dtype', None) == object:
+        mapped = np.empty(value.shape, dtype=object)
+        for index in np.ndindex(value.shape):
+            mapped[index] = _map(value[index], func)
+
+        return mapped
+
+    return func(value)
+
+
+
+def _unwrap(value):
+    ''' Replaces proxies with the draft objects they stand in for'''
+
+    return _map(value, lambda value: value._target if isinstance(value, _Proxy) else value)
+
+
+
+def _resolve(value, objects):
+    ''' Replaces the slots in a recorded value with the objects of the final figure'''
+
+    def resolve(value):
+        if isinstance(value, _Slot):
+            return objects[value.slot]
+
+        # Objects copied when recorded are copied again, so that they can be added to more than one final figure
+        if _is_matplotlib(value):
+            return copy.copy(value)
+
+        return value
+
+    return _map(value, resolve)
+
+
+
+def _replay(operation, objects):
+
+    kind = operation[0]
+
+    if kind == 'call':
+        _, slot, name, args, kwargs, result = operation
+        objects[result] = getattr(objects[slot], name)(*_resolve(args, objects), **_resolve(kwargs, objects))
+
+    elif kind == 'function':
+        _, func, args, kwargs, result = operation
+        objects[result] = func(*_resolve(args, objects), **_resolve(kwargs, objects))
+
+    elif kind == 'getattr':
+        _, slot, name, result = operation
+        objects[result] = getattr(objects[slot], name)
+
+    elif kind == 'setattr':
+        _, slot, name, value = operation
+        setattr(objects[slot], name, _resolve(value, objects))
+
+    elif kind == 'item':
+        _, slot, key, result = operation
+        objects[result] = objects[slot][key]
+
+
+
+def _reduce(ax, name, args, kwargs, options):
+    ''' Reduces the data of ax.plot (x, y[, fmt]) and ax.scatter (x, y, ...) to the resolution of the draft'''
+
+    if name == 'plot' and options['draft_decimation'] and len(args) in (2, 3) and (len(args) == 2 or isinstance(args[2], str)):
+        x, y = np.asarray(args[0]), np.asarray(args[1])
+
+        if x.ndim == 1 and y.shape == x.shape and np.issubdtype(x.dtype, np.number) and np.issubdtype(y.dtype, np.number):
+            # minmax needs sorted x
+            if options['draft_decimation'] != 'minmax' or np.all(x[1:] >= x[:-1]):
+                x, y = decimation.decimate(ax=ax, x=x, y=y, options={'decimation': options['draft_decimation']})
+                args = (x, y) + tuple(args[2:])
+
+    elif name == 'scatter' and options['draft_max_points'] and len(args) >= 2:
+        n = len(args[0])
+
+        if n > options['draft_max_points']:
+            step = -(-n // options['draft_max_points'])
+
+            # Every array with a value per point (x, y, sizes, colours etc.) is thinned the same way
+            def thin(value):
+                return np.asarray(value)[::step] if isinstance(value, (list, np.ndarray)) and len(value) == n else value
+
+            args = tuple(thin(arg) for arg in args)
+            kwargs = {key: thin(value) for key, value in kwargs.items()}
+
+    return args, kwargs
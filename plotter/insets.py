@@ -0,0 +1,180 @@
+import plotter.auxillary as aux
+import plotter.decimation as decimation
+import plotter.draft as draft
+import plotter.instrumentation as inst
+import plotter.plots as plots
+
+# Imported the first time they are used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+mticker = aux.lazy_import('matplotlib.ticker')
+
+
+@draft.recordable
+def plot_inset(parent_ax, index, options={}, **kwargs):
+    ''' Makes an inset of parent_ax (see plots.prepare_inset_axes) showing options['inset_xlim'] and options['inset_ylim'] of the data in index (from index_line or index_points), and draws only the data within these limits.
+    Any keyword arguments are passed on to ax.plot (lines) or ax.scatter (points).
+
+    The same index can be used for any number of insets, so the data is only sorted once. If options['decimation'] is set, the visible data is also reduced to the resolution of the inset:
+    lines as in decimation.decimate, and points by keeping a single point per pixel.
+
+    If no tick locators are passed for the inset, matplotlib's automatic locators are used. Returns the inset Axes-object and the artist that was drawn.'''
+
+    default_options = {
+        'inset_xlim': None, # Limits of the inset. Defaults to the range of the data.
+        'inset_ylim': None, # Limits of the inset. Lines are autoscaled to the visible data if not set.
+        'decimation': None, # None, or 'minmax' or 'lttb' for lines. Any value for points keeps one point per pixel.
+    }
+
+    automatic_locators = [axis for axis in ('x', 'y') if f'inset_{axis}_tick_locators' not in options.keys()]
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    timer = inst.stages('plot_inset', options)
+
+    inset_ax = plots.prepare_inset_axes(parent_ax, options)
+
+    # The inset is only moved into place by its axes locator when drawn. Place it now, so that the data is reduced to the size of the inset rather than of its placeholder bounding box.
+    if inset_ax.get_axes_locator() is not None:
+        inset_ax.apply_aspect(inset_ax.get_axes_locator()(inset_ax, None))
+
+    for axis in automatic_locators:
+        getattr(inset_ax, f'{axis}axis').set_major_locator(mticker.AutoLocator())
+        getattr(inset_ax, f'{axis}axis').set_minor_locator(mticker.NullLocator())
+
+    xlim = tuple(options['inset_xlim']) if options['inset_xlim'] is not None else None
+    ylim = tuple(options['inset_ylim']) if options['inset_ylim'] is not None else None
+
+    # Set the limits before decimating, so the data is reduced to the width of the inset in pixels over these limits
+    if xlim is not None:
+        inset_ax.set_xlim(xlim)
+    if ylim is not None:
+        inset_ax.set_ylim(ylim)
+
+    x, y = query(index, xlim=xlim, ylim=ylim)
+
+    timer.lap('query')
+
+    if index['kind'] == 'line':
+        if options['decimation']:
+            x, y = decimation.decimate(ax=inset_ax, x=x, y=y, options=options)
+
+        artist = inset_ax.plot(x, y, **kwargs)[0]
+
+    else:
+        if options['decimation'] and len(x) > 0:
+            x, y = _one_per_pixel(inset_ax, x, y)
+
+        artist = inset_ax.scatter(x, y, **kwargs)
+
+    timer.lap('draw')
+    timer.finish()
+
+    return inset_ax, artist
+
+
+
+def index_line(x, y):
+    ''' Indexes line data for query, by sorting it along x (unless it already is sorted). Returns the index as a dictionary.'''
+
+    x, y = np.asarray(x), np.asarray(y)
+
+    if len(x) > 1 and np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+
+    return {'kind': 'line', 'x': x, 'y': y}
+
+
+
+def index_points(x, y, points_per_cell=16):
+    ''' Indexes scattered points for query, by bucketing them in a uniform grid with on average points_per_cell points per cell. The points are sorted by cell, so that the points of a row of cells are contiguous.
+    Returns the index as a dictionary.'''
+
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+
+    if len(x) == 0:
+        return {'kind': 'points', 'x': x, 'y': y, 'xlim': (0., 1.), 'ylim': (0., 1.), 'shape': (1, 1), 'starts': np.zeros(2, dtype=np.intp)}
+
+    xlim, ylim = (x.min(), x.max()), (y.min(), y.max())
+
+    cells = max(int(np.sqrt(len(x) / points_per_cell)), 1)
+    shape = (cells, cells) # rows, columns
+
+    cell = _get_cells(x, y, xlim, ylim, shape)
+
+    order = np.argsort(cell, kind='stable')
+
+    # Index of the first point of every cell, and the end of the last cell
+    starts = np.searchsorted(cell[order], np.arange(shape[0]*shape[1]+1))
+
+    return {'kind': 'points', 'x': x[order], 'y': y[order], 'xlim': xlim, 'ylim': ylim, 'shape': shape, 'starts': starts}
+
+
+
+def query(index, xlim=None, ylim=None):
+    ''' Returns the x and y of the data in index within xlim and ylim (None for no limit).
+
+    For lines, the data is sliced with a binary search on x, and the nearest point outside on either side is kept so that the line continues to the edge of the Axes-object. ylim is not used for lines.
+    For points, only the cells of the grid that overlap the limits are searched.'''
+
+    x, y = index['x'], index['y']
+
+    if index['kind'] == 'line':
+        if xlim is None:
+            return x, y
+
+        start = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+        stop = min(np.searchsorted(x, xlim[1], side='right') + 1, len(x))
+
+        return x[start:stop], y[start:stop]
+
+
+    xlim = index['xlim'] if xlim is None else (min(xlim), max(xlim))
+    ylim = index['ylim'] if ylim is None else (min(ylim), max(ylim))
+
+    rows, columns = index['shape']
+
+    # Range of cells overlapping the limits
+    (left, right), (bottom, top) = [np.clip(((np.asarray(lim) - data_lim[0]) * (n / ((data_lim[1] - data_lim[0]) or 1))).astype(np.intp), 0, n-1) for lim, data_lim, n in ((xlim, index['xlim'], columns), (ylim, index['ylim'], rows))]
+
+    if xlim[1] < index['xlim'][0] or xlim[0] > index['xlim'][1] or ylim[1] < index['ylim'][0] or ylim[0] > index['ylim'][1]:
+        return x[:0], y[:0]
+
+    # The cells of each row within the range are contiguous in the sorted data
+    row_starts = index['starts'][np.arange(bottom, top+1)*columns + left]
+    row_stops = index['starts'][np.arange(bottom, top+1)*columns + right + 1]
+
+    candidates = np.concatenate([np.arange(start, stop) for start, stop in zip(row_starts, row_stops)])
+
+    inside = (x[candidates] >= xlim[0]) & (x[candidates] <= xlim[1]) & (y[candidates] >= ylim[0]) & (y[candidates] <= ylim[1])
+
+    return x[candidates[inside]], y[candidates[inside]]
+
+
+
+def _get_cells(x, y, xlim, ylim, shape):
+
+    rows, columns = shape
+
+    ix = np.minimum(((x - xlim[0]) * (columns / ((xlim[1] - xlim[0]) or 1))).astype(np.intp), columns-1)
+    iy = np.minimum(((y - ylim[0]) * (rows / ((ylim[1] - ylim[0]) or 1))).astype(np.intp), rows-1)
+
+    return iy*columns + ix
+
+
+
+def _one_per_pixel(ax, x, y):
+    ''' Keeps the first of the points that fall within the same pixel of ax'''
+
+    xlim = sorted(ax.get_xlim()) if not ax.get_autoscalex_on() else (x.min(), x.max())
+    ylim = sorted(ax.get_ylim()) if not ax.get_autoscaley_on() else (y.min(), y.max())
+    shape = (max(int(np.ceil(decimation.axes_pixel_height(ax))), 1), max(int(np.ceil(decimation.axes_pixel_width(ax))), 1))
+
+    _, first = np.unique(_get_cells(x, y, xlim, ylim, shape), return_index=True)
+    first.sort()
+
+    return x[first], y[first]
@@ -0,0 +1,168 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+_hooks = []
+_local = threading.local()
+
+
+def add_hook(func):
+    ''' Adds a function that is called with every record, as func(record)'''
+
+    _hooks.append(func)
+
+
+def remove_hook(func):
+    ''' Removes a function added with add_hook'''
+
+    _hooks.remove(func)
+
+
+def is_enabled():
+    ''' Whether anything is listening for records, either hooks or an active collect-context in the current thread'''
+
+    return bool(_hooks) or bool(getattr(_local, 'collectors', None))
+
+
+@contextlib.contextmanager
+def collect(trace_memory=False):
+    ''' Context manager that collects all records made in the current thread into a list. If trace_memory is True, tracemalloc is started (if it is not already) to record changes in memory.
+
+    with instrumentation.collect(trace_memory=True) as records:
+        fig, ax = plots.prepare_plot(options)
+        ...
+
+    Every record is a dictionary with the name of the stage, its wall time in seconds, the change in memory traced by tracemalloc (None if memory is not traced),
+    the time it started, the process and thread ids, and a copy of the options that drove it. Nothing is recorded unless records are collected or a hook is added with add_hook.'''
+
+    records = []
+
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+
+    if started_tracing:
+        tracemalloc.start()
+
+    _local.collectors.append(records)
+
+    try:
+        yield records
+    finally:
+        _local.collectors.remove(records)
+
+        if started_tracing:
+            tracemalloc.stop()
+
+
+
+def stages(name, options=None):
+    ''' Starts timing a stage with the given name. Call lap(substage) at the end of every part of the stage to record it as name.substage, and finish() at the end to record the whole stage.
+    Returns an object that does nothing if instrumentation is not enabled, so it can be left in hot paths.'''
+
+    if not is_enabled():
+        return _NULL_STAGES
+
+    return Stages(name, options)
+
+
+
+@contextlib.contextmanager
+def stage(name, options=None):
+    ''' Context manager that records the code within it as a single stage, e.g. to time saving:
+
+    with instrumentation.stage('savefig', options):
+        fig.savefig(path)
+    '''
+
+    timer = stages(name, options)
+
+    try:
+        yield
+    finally:
+        timer.finish()
+
+
+
+def export_records(records, path):
+    ''' Appends records to a file as JSON lines. Values that are not JSON-serialisable are written as their repr.'''
+
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record, default=repr) + '\n')
+
+
+
+def emit(record):
+    ''' Passes a record on to all hooks and active collectors'''
+
+    for hook in list(_hooks):
+        hook(record)
+
+    for records in getattr(_local, 'collectors', []):
+        records.append(record)
+
+
+
+class Stages:
+    ''' Times a stage and its parts. Returned by stages() when instrumentation is enabled.'''
+
+    def __init__(self, name, options=None):
+        self.name = name
+        self.options = dict(options) if options else {}
+        self.start = self.lap_start = time.perf_counter()
+        self.wall_start = self.lap_wall_start = time.time()
+        self.memory_start = self.lap_memory_start = _traced_memory()
+
+
+    def lap(self, substage):
+        now, memory = time.perf_counter(), _traced_memory()
+
+        self._record(f'{self.name}.{substage}', now - self.lap_start, self.lap_wall_start, self.lap_memory_start, memory)
+
+        self.lap_start, self.lap_wall_start, self.lap_memory_start = now, time.time(), memory
+
+
+    def finish(self):
+        self._record(self.name, time.perf_counter() - self.start, self.wall_start, self.memory_start, _traced_memory())
+
+
+    def _record(self, name, elapsed, wall_start, memory_start, memory):
+        emit({
+            'stage': name,
+            'time': elapsed,
+            'memory_delta': memory - memory_start if memory is not None and memory_start is not None else None,
+            'start': wall_start,
+            'pid': os.getpid(),
+            'thread': threading.get_ident(),
+            'options': self.options,
+        })
+
+
+
+class _NullStages:
+
+    def lap(self, substage):
+        pass
+
+    def finish(self):
+        pass
+
+
+_NULL_STAGES = _NullStages()
+
+
+def _traced_memory():
+
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+
+    return None
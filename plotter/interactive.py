@@ -1,3 +1,10 @@
+import plotter.auxillary as aux
+
+# Imported the first time they are used (see aux.lazy_import)
+asyncio = aux.lazy_import('asyncio')
+matplotlib = aux.lazy_import('matplotlib')
+ipython_display = aux.lazy_import('IPython.display')
+
 def ipywidgets_update(func, data, options={}, **kwargs):
     ''' A general ipywidgets update function that can be passed to ipywidgets.interactive. To use this, you can run:
 
@@ -14,4 +21,146 @@ def ipywidgets_update(func, data, options={}, **kwargs):
         options[key] = kwargs[key]
 
     # Call the function with the plot_data and options-dictionaries
-    func(data=data, options=options)
\ No newline at end of file
+    func(data=data, options=options)
+
+
+def ipywidgets_artist_update(build_func, update_func, data, options={}, blit=True, debounce=0.1):
+    ''' Returns an update function that can be passed to ipywidgets.interactive, which builds the figure only once and then updates its artists in place on every widget change. To use this, you can run:
+
+    import ipywidgets as widgets
+    import plotter.interactive as plint
+
+    update = plint.ipywidgets_artist_update(build_func=my_build_func, update_func=my_update_func, data=plot_data, options=options)
+    w = widgets.interactive(update, key1=widget1, key2=widget2, key3=widget3)
+
+    build_func is called once as build_func(data=data, options=options), and should return fig, ax and a dictionary of the artists that will be updated (e.g. the Line2D-objects returned by ax.plot).
+    update_func is then called as update_func(fig=fig, ax=ax, artists=artists, data=data, options=options, changed=changed) on every change, where changed is a dictionary of the options that changed.
+    It should update the data, limits, labels or styles of the existing artists, and return the list of artists it changed if only these need to be redrawn, or None if the whole figure should be redrawn (e.g. if limits or labels changed).
+
+    With an interactive backend (e.g. ipympl), the artists in the dictionary are drawn with blitting if blit is True and the canvas supports it, and rapid widget changes are debounced so that only the last change within debounce seconds is drawn.
+    With the inline backend, the figure is displayed again after every change instead.
+
+    The figure is available as update.state['fig'].'''
+
+    state = {'fig': None, 'ax': None, 'artists': None, 'background': None, 'pending': {}, 'timer': None}
+
+    def update(**kwargs):
+
+        # Only pass on the options that actually changed. A value that changes back within the debounce window (A to B to A) is dropped, rather than leaving B pending.
+        for key in kwargs:
+            if state['fig'] is None or _has_changed(options, key, kwargs[key]):
+                state['pending'][key] = kwargs[key]
+            else:
+                state['pending'].pop(key, None)
+
+        if state['timer']:
+            state['timer'].cancel()
+            state['timer'] = None
+
+        loop = _get_running_loop()
+
+        if debounce and loop and state['fig'] is not None and not _is_inline():
+            state['timer'] = loop.call_later(debounce, _apply_update, build_func, update_func, data, options, blit, state)
+        else:
+            _apply_update(build_func, update_func, data, options, blit, state)
+
+    update.state = state
+
+    return update
+
+
+
+def _apply_update(build_func, update_func, data, options, blit, state):
+
+    changed = state['pending']
+    state['pending'] = {}
+    state['timer'] = None
+
+    # Update the options-dictionary with the values from the widgets
+    options.update(changed)
+
+    if state['fig'] is None:
+        fig, ax, artists = build_func(data=data, options=options)
+
+        state['fig'], state['ax'], state['artists'] = fig, ax, artists
+
+        if blit and fig.canvas.supports_blit and not _is_inline():
+            # Animated artists are left out of regular draws, and drawn on top of the saved background instead
+            for artist in artists.values():
+                artist.set_animated(True)
+
+            fig.canvas.mpl_connect('draw_event', lambda event: _save_background(state))
+
+        # With the inline backend, ipywidgets.interactive shows the new figure itself
+        if not _is_inline():
+            fig.canvas.draw_idle()
+
+        return
+
+    if not changed:
+        return
+
+    fig = state['fig']
+
+    updated = update_func(fig=fig, ax=state['ax'], artists=state['artists'], data=data, options=options, changed=changed)
+
+    if updated and state['background'] is not None and all(artist.get_animated() for artist in updated):
+        fig.canvas.restore_region(state['background'])
+
+        for artist in state['artists'].values():
+            fig.draw_artist(artist)
+
+        fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+
+    else:
+        _show(state)
+
+
+
+def _save_background(state):
+
+    fig = state['fig']
+
+    state['background'] = fig.canvas.copy_from_bbox(fig.bbox)
+
+    for artist in state['artists'].values():
+        fig.draw_artist(artist)
+
+
+
+def _show(state):
+
+    if _is_inline():
+        ipython_display.display(state['fig'])
+
+    else:
+        state['fig'].canvas.draw_idle()
+
+
+
+def _has_changed(options, key, value):
+
+    if key not in options.keys():
+        return True
+
+    try:
+        return bool(options[key] != value)
+    except (TypeError, ValueError):
+        # E.g. arrays, where != is ambiguous
+        return options[key] is not value
+
+
+
+def _is_inline():
+
+    return 'inline' in matplotlib.get_backend()
+
+
+
+def _get_running_loop():
+
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
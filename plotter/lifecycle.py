@@ -0,0 +1,137 @@
+import plotter.auxillary as aux
+
+import contextlib
+import os
+import sys
+import threading
+import time
+import weakref
+
+# Imported the first time they are used (see aux.lazy_import)
+plt = aux.lazy_import('matplotlib.pyplot')
+plots = aux.lazy_import('plotter.plots')
+
+
+ARTIST_BYTES = 4096 # Rough memory of a single artist (line, patch, text etc.) without its data
+
+_figures = weakref.WeakKeyDictionary() # figure -> where and when it was made by prepare_plot
+_figures_lock = threading.Lock()
+
+_PACKAGE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+@contextlib.contextmanager
+def managed_figure(options={}):
+    ''' Context manager that makes a figure with prepare_plot, and closes it when the block exits, also if an exception is raised:
+
+    with lifecycle.managed_figure(options) as (fig, ax):
+        ...
+        fig.savefig(path)
+
+    Set options['pyplot'] to False to make the figure without registering it with pyplot (see prepare_plot).'''
+
+    fig, axes = plots.prepare_plot(options)
+
+    try:
+        yield fig, axes
+    finally:
+        close_figure(fig)
+
+
+
+def close_figure(fig):
+    ''' Closes fig: removes it from pyplot (if registered), removes all its artists, and frees the buffer of its canvas. Any remaining references to fig then only keep an empty figure alive.'''
+
+    plt.close(fig)
+
+    fig.clear()
+
+    # The Agg-canvas keeps its last renderer, which holds the RGBA-buffer of the whole figure
+    if 'renderer' in vars(fig.canvas):
+        del fig.canvas.renderer
+
+    with _figures_lock:
+        _figures.pop(fig, None)
+
+
+
+def register_figure(fig):
+    ''' Records where (the first caller outside plotter) and when fig was made, for live_figures. Called by prepare_plot.'''
+
+    frame = sys._getframe(1)
+
+    while frame is not None and os.path.dirname(os.path.abspath(frame.f_code.co_filename)) == _PACKAGE_FOLDER:
+        frame = frame.f_back
+
+    site = f'{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}' if frame is not None else None
+
+    with _figures_lock:
+        _figures[fig] = {'site': site, 'created': time.time()}
+
+
+
+def live_figures():
+    ''' Returns a list with a dictionary for every figure that is still alive: made by prepare_plot and not yet closed (or, without pyplot, not yet freed), or open in pyplot.
+
+    Every dictionary has the figure number in pyplot (None if not registered with pyplot), the size in pixels, the estimated memory in bytes (see estimate_bytes),
+    the call site that made it ('file:line in function', None if not made by prepare_plot), and the age in seconds.'''
+
+    with _figures_lock:
+        tracked = list(_figures.items())
+
+    figures = {id(fig): (fig, info) for fig, info in tracked}
+    numbers = {}
+
+    # Figures open in pyplot, including those not made by prepare_plot. Nothing can be open if pyplot has not been imported.
+    if 'matplotlib.pyplot' in sys.modules:
+        for manager in plt._pylab_helpers.Gcf.get_all_fig_managers():
+            fig = manager.canvas.figure
+            figures.setdefault(id(fig), (fig, {'site': None, 'created': None}))
+            numbers[id(fig)] = manager.num
+
+    now = time.time()
+    report = []
+
+    for key, (fig, info) in figures.items():
+        width, height = fig.get_size_inches() * fig.dpi
+
+        report.append({
+            'number': numbers.get(key),
+            'size': (int(round(width)), int(round(height))),
+            'bytes': estimate_bytes(fig),
+            'site': info['site'],
+            'age': now - info['created'] if info['created'] is not None else None,
+        })
+
+    return report
+
+
+
+def diagnostics():
+    ''' Summarises live_figures: the number of live figures, their total estimated memory, and the number and memory of the figures made at each call site, largest first.
+    A call site that keeps adding figures is usually where figures are made and never closed.'''
+
+    figures = live_figures()
+
+    sites = {}
+    for figure in figures:
+        site = sites.setdefault(figure['site'], {'site': figure['site'], 'figures': 0, 'bytes': 0})
+        site['figures'] += 1
+        site['bytes'] += figure['bytes']
+
+    return {
+        'figures': len(figures),
+        'bytes': sum(figure['bytes'] for figure in figures),
+        'sites': sorted(sites.values(), key=lambda site: site['bytes'], reverse=True),
+    }
+
+
+
+def estimate_bytes(fig):
+    ''' Estimates the memory of a figure from the size of its RGBA-buffer when drawn, and from its artists (a rough fixed cost per artist)'''
+
+    width, height = fig.get_size_inches() * fig.dpi
+
+    artists = sum(len(ax.get_children()) for ax in fig.axes)
+
+    return int(width * height * 4) + artists * ARTIST_BYTES
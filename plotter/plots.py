@@ -1,36 +1,200 @@
 # Helper functions
 import plotter.auxillary as aux
 import plotter.colours as col
+import plotter.draft as draft
+import plotter.instrumentation as inst
+import plotter.lifecycle as lifecycle
 
-# For plotting
-import matplotlib.pyplot as plt
 import itertools
-from matplotlib.lines import Line2D
-from matplotlib.ticker import (MultipleLocator)
-from matplotlib.patches import Rectangle
+import collections
+import contextlib
+import copy
+import os
+import sys
+import threading
+import warnings
+
+# For plotting. These are imported the first time they are used (see aux.lazy_import)
+matplotlib = aux.lazy_import('matplotlib')
+plt = aux.lazy_import('matplotlib.pyplot')
+mstyle = aux.lazy_import('matplotlib.style.core')
+mfigure = aux.lazy_import('matplotlib.figure')
+backend_agg = aux.lazy_import('matplotlib.backends.backend_agg')
+mlines = aux.lazy_import('matplotlib.lines')
+mticker = aux.lazy_import('matplotlib.ticker')
+mcollections = aux.lazy_import('matplotlib.collections')
+np = aux.lazy_import('numpy')
 
 # To create insets
-from mpl_toolkits.axes_grid1.inset_locator import (inset_axes, InsetPosition, BboxPatch, BboxConnector)
-from matplotlib.transforms import TransformedBbox
+inset_locator = aux.lazy_import('mpl_toolkits.axes_grid1.inset_locator')
+mtransforms = aux.lazy_import('matplotlib.transforms')
+
+def use_headless(backend='Agg'):
+    ''' Selects a non-interactive backend for matplotlib. If matplotlib is not imported yet, the backend is set through the MPLBACKEND environment variable, so that no backend resolution is needed on import.'''
+
+    if 'matplotlib' in sys.modules:
+        matplotlib.use(backend)
+    else:
+        os.environ['MPLBACKEND'] = backend
+
 
 def prepare_plot(options={}):
     ''' A general function to prepare a plot based on contents of options['rc_params'] and options['format_params'].
     
     rc_params is a dictionary with keyval-pairs corresponding to rcParams in matplotlib, to give the user full control over this. Please consult the matplotlib-documentation
     
-    format_params will determine the size, aspect ratio, resolution etc. of the figure. Should be modified to conform with any requirements from a journal.'''
+    format_params will determine the size, aspect ratio, resolution etc. of the figure. Should be modified to conform with any requirements from a journal.
+    
+    The combination of rc_params and format_params is compiled once and cached (see compile_style). The style is applied to the global rcParams, which are left changed when prepare_plot returns.
+    To avoid changing the global rcParams, and to build figures from more than one thread, build and save the figure inside style_context(options).
 
-    if 'rc_params' in options.keys():
-        rc_params = options['rc_params']
-    else:
-        rc_params = {}
+    If options['pyplot'] is False, the figure is made directly as a matplotlib.figure.Figure with an Agg-canvas, and is not registered with pyplot. It is then freed as soon as it is no longer referenced,
+    rather than when closed with plt.close. All figures are tracked for lifecycle.live_figures.
+
+    If options['draft'] is True, returns a draft figure at screen resolution instead, which records the plotting calls made on it so that they can be replayed at full resolution with fig.finalise(path) (see draft.prepare_draft).'''
+
+    if options.get('draft', False):
+        return draft.prepare_draft(options)
+
+    timer = inst.stages('prepare_plot', options)
 
+    style = compile_style(options)
 
+    # Write the resolved format parameters back to the passed dictionary
     if 'format_params' in options.keys():
-        format_params = options['format_params']
-    else:
-        format_params = {}
+        options['format_params'].update(copy.deepcopy(style.format_params))
+
+    format_params = style.format_params
+
+    # Reset run commands and update with those passed
+    apply_style(style)
+
+    timer.lap('style')
     
+    if options.get('pyplot', True) is False:
+        fig = mfigure.Figure(figsize=(format_params['width'], format_params['height']), dpi=format_params['dpi'], facecolor=None if format_params['nrows'] == 1 and format_params['ncols'] == 1 else 'w')
+        backend_agg.FigureCanvasAgg(fig)
+    else:
+        fig = None
+
+    if format_params['nrows'] == 1 and format_params['ncols'] == 1:
+        if fig is None:
+            fig, ax = plt.subplots(figsize=(format_params['width'], format_params['height']), dpi=format_params['dpi'])
+        else:
+            ax = fig.subplots()
+
+        lifecycle.register_figure(fig)
+
+        timer.lap('subplots')
+        timer.finish()
+        
+        return fig, ax
+
+    else:
+        if fig is None:
+            fig, axes = plt.subplots(nrows=format_params['nrows'], ncols=format_params['ncols'], figsize=(format_params['width'],format_params['height']), 
+            gridspec_kw={'height_ratios': format_params['grid_ratio_height'], 'width_ratios': format_params['grid_ratio_width']}, 
+            facecolor='w', dpi=format_params['dpi'])
+        else:
+            axes = fig.subplots(nrows=format_params['nrows'], ncols=format_params['ncols'], gridspec_kw={'height_ratios': format_params['grid_ratio_height'], 'width_ratios': format_params['grid_ratio_width']})
+
+        lifecycle.register_figure(fig)
+
+        timer.lap('subplots')
+        timer.finish()
+
+        return fig, axes
+
+
+class Style:
+    ''' A compiled, hashable combination of rc_params and format_params. rc_params contains the complete set of (validated) rcParams to apply, and format_params the resolved format parameters.
+    Should not be modified, as instances are shared through the style cache.'''
+
+    __slots__ = ('key', 'rc_params', 'format_params')
+
+    def __init__(self, key, rc_params, format_params):
+        self.key = key
+        self.rc_params = rc_params
+        self.format_params = format_params
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, Style) and self.key == other.key
+
+
+STYLE_CACHE_SIZE = 128
+
+_style_cache = collections.OrderedDict()
+_style_cache_lock = threading.Lock()
+
+# rcParams are global to the process, so style_context holds this while its style is applied. Re-entrant, so that a style_context can be nested in another on the same thread.
+_style_lock = threading.RLock()
+
+
+def compile_style(options={}):
+    ''' Compiles options['rc_params'] and options['format_params'] into a Style. The STYLE_CACHE_SIZE most recently used styles are cached, so that repeated calls with the same options skip validation and resolving.'''
+
+    rc_params = options['rc_params'] if 'rc_params' in options.keys() and options['rc_params'] else {}
+    format_params = options['format_params'] if 'format_params' in options.keys() and options['format_params'] else {}
+
+    key = (aux.freeze(rc_params), aux.freeze(format_params))
+
+    with _style_cache_lock:
+        if key in _style_cache:
+            _style_cache.move_to_end(key)
+            return _style_cache[key]
+
+    # Start from matplotlib's defaults (same as plt.rcdefaults()) and validate the passed rc_params once
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', matplotlib.MatplotlibDeprecationWarning)
+        compiled_rc_params = {key: val for key, val in matplotlib.rcParamsDefault.items() if key not in mstyle.STYLE_BLACKLIST}
+
+    compiled_rc_params.update(matplotlib.RcParams(rc_params))
+
+    style = Style(key=key, rc_params=compiled_rc_params, format_params=resolve_format_params(copy.deepcopy(format_params)))
+
+    with _style_cache_lock:
+        _style_cache[key] = style
+        _style_cache.move_to_end(key)
+
+        while len(_style_cache) > STYLE_CACHE_SIZE:
+            _style_cache.popitem(last=False)
+
+    return style
+
+
+def apply_style(style):
+    ''' Replaces the current rcParams with those of a compiled Style. The values are already validated, so they are written directly rather than one key at a time.'''
+
+    dict.update(plt.rcParams, style.rc_params)
+
+
+@contextlib.contextmanager
+def style_context(options={}):
+    ''' Context manager that applies the style compiled from options, and restores the previous rcParams on exit. Build, adjust and save the figure within the context:
+
+    with style_context(options):
+        fig, ax = prepare_plot(options)
+        ...
+        fig.savefig(path)
+
+    rcParams are global to the process, so other threads entering a style_context wait until the block exits. prepare_plot outside a style_context still changes the global rcParams, and leaves them changed.
+    '''
+
+    with _style_lock:
+        original_rc_params = dict(plt.rcParams)
+
+        try:
+            apply_style(compile_style(options))
+            yield
+        finally:
+            dict.update(plt.rcParams, original_rc_params)
+
+
+def resolve_format_params(format_params):
+    ''' Sets defaults and determines the width and height of the figure from the format_params'''
 
     default_format_params = {
     'single_column_width': 8.3,
@@ -52,13 +216,6 @@ def prepare_plot(options={}):
     
     format_params = aux.update_options(options=format_params, default_options=default_format_params)
 
-
-    # Reset run commands
-    plt.rcdefaults()
-    
-    # Update run commands if any is passed (will pass an empty dictionary if not passed)
-    update_rc_params(rc_params)
-    
     if not format_params['width']:
         format_params['width'] = determine_width(format_params=format_params)
     
@@ -66,29 +223,18 @@ def prepare_plot(options={}):
         format_params['height'] = determine_height(format_params=format_params, width=format_params['width'])
 
     format_params['width'], format_params['height'] = scale_figure(format_params=format_params, width=format_params['width'], height=format_params['height'])
-    
-    if format_params['nrows'] == 1 and format_params['ncols'] == 1:
-        fig, ax = plt.subplots(figsize=(format_params['width'], format_params['height']), dpi=format_params['dpi'])
-        
-        return fig, ax
-
-    else:
-        if not format_params['grid_ratio_height']:
-            format_params['grid_ratio_height'] = [1 for i in range(format_params['nrows'])]
 
-        if not format_params['grid_ratio_width']:
-            format_params['grid-ratio_width'] = [1 for i in range(format_params['ncols'])]
+    if not format_params['grid_ratio_height']:
+        format_params['grid_ratio_height'] = [1 for i in range(format_params['nrows'])]
 
-        fig, axes = plt.subplots(nrows=format_params['nrows'], ncols=format_params['ncols'], figsize=(format_params['width'],format_params['height']), 
-        gridspec_kw={'height_ratios': format_params['grid_ratio_height'], 'width_ratios': format_params['grid_ratio_width']}, 
-        facecolor='w', dpi=format_params['dpi'])
+    if not format_params['grid_ratio_width']:
+        format_params['grid_ratio_width'] = [1 for i in range(format_params['ncols'])]
 
-        return fig, axes
+    return format_params
 
 
-def adjust_plot(fig, ax, options):
-    ''' A general function to adjust plot according to contents of the options-dictionary '''
-    
+def get_default_adjust_options():
+    ''' Returns the default options of adjust_plot'''
 
     default_options = {
         'plot_kind': None, # defaults to None, but should be utilised when requiring special formatting for a particular plot 
@@ -114,10 +260,179 @@ def adjust_plot(fig, ax, options):
         'text': None, # Text to show in the plot. Should be a list where the first element is the string, and the second is a tuple with x- and y-coordinates. Could also be a list of lists to show more strings of text.
     }
 
+    return default_options
+
+
+@draft.recordable
+def adjust_plot(fig, ax, options):
+    ''' A general function to adjust plot according to contents of the options-dictionary '''
+    
+
+    default_options = get_default_adjust_options()
+
 
     options = aux.update_options(options=options, default_options=default_options)
 
+    timer = inst.stages('adjust_plot', options)
+
     # Set labels on x- and y-axes
+    adjust_labels(ax=ax, options=options)
+        
+    timer.lap('labels')
+
+    adjust_ticks(ax=ax, options=options)
+
+    timer.lap('ticks')
+
+     
+
+    #### DRAW/REMOVE LEGEND ####
+    # Options:
+    # 'legend_position': (default ['lower center', (0.5, -0.1)]) - Follows matplotlib's way of specifying legend position
+    # 'legend_ncol': (default 1) # Number of columns to write the legend in
+    # Also requires options to contain values in colours, markers and labels. (No defaults)
+
+    adjust_legend(ax=ax, options=options)
+
+    timer.lap('legend')
+
+    # Adjust where the axes start within the figure. Default value is 10% in from the left and bottom edges. Used to make room for the plot within the figure size (to avoid using bbox_inches='tight' in the savefig-command, as this screws with plot dimensions)
+    fig.subplots_adjust(**options['subplots_adjust'])
+
+
+    # If limits for x- and y-axes is passed, sets these.
+    if options['xlim'] is not None:
+        ax.set_xlim(options['xlim'])
+
+    if options['ylim'] is not None:
+        ax.set_ylim(options['ylim'])
+
+
+    timer.lap('subplots_adjust')
+
+    #### DRAW BACKGROUNDS ####
+    # options['backgrounds'] should contain a dictionary or a list of dictionaries, or an array of (start, end)-intervals along the x-axis. See draw_backgrounds for the options.
+
+    if options['backgrounds'] is not None and len(options['backgrounds']) > 0:
+        draw_backgrounds(ax=ax, backgrounds=options['backgrounds'], xlim_reset=options['xlim_reset'], ylim_reset=options['ylim_reset'])
+
+
+    timer.lap('backgrounds')
+
+    # Add custom text
+    if options['text']:
+        draw_text(ax=ax, text=options['text'])
+
+    timer.lap('text')
+    timer.finish()
+    
+    return fig, ax
+
+
+
+@draft.recordable
+def adjust_grid(fig, axes, options={}, per_axis_overrides=None):
+    ''' Adjusts all Axes-objects of a grid from prepare_plot in one pass, like calling adjust_plot on each of them, but with the defaults merged once, figure-level settings (subplots_adjust) applied once,
+    and legend handles built once and shared by all Axes-objects that use the same options.
+
+    per_axis_overrides changes options for single Axes-objects. It is either a dictionary with (row, column)-tuples or indices into axes.flat as keys and dictionaries of options as values,
+    or a list (of lists) of dictionaries (or None) with the same shape as axes.
+
+    With options['sharex'] set to 'col' (or 'all') the x-axes of each column (or of all Axes-objects) are shared, so that ticks are set up once per column, and only the bottom row shows x-labels and ticklabels.
+    options['sharey'] works the same for the y-axes of each 'row'. Limits and tick locators of a shared axis are taken from the first Axes-object of the column or row.'''
+
+    default_options = get_default_adjust_options()
+    default_options.update({
+        'sharex': None, # None, 'col' or 'all'
+        'sharey': None, # None, 'row' or 'all'
+        'grid_legend': 'each', # 'each' to draw a legend in every Axes-object with options['legend'], or 'figure' to draw one legend for the figure from the shared options
+    })
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    timer = inst.stages('adjust_grid', options)
+
+    axes_list = list(axes.flat) if hasattr(axes, 'flat') else [axes]
+    nrows, ncols = axes_list[0].get_subplotspec().get_gridspec().get_geometry()
+
+    positions = [(ax.get_subplotspec().rowspan.start, ax.get_subplotspec().colspan.start) for ax in axes_list]
+    overrides = _get_overrides(per_axis_overrides, axes, positions)
+
+    # The first Axes-object of each group of shared axes sets the locators for the whole group
+    leaders = {}
+    for axis, share, group in (('x', options['sharex'], lambda row, col: col), ('y', options['sharey'], lambda row, col: row)):
+        if share:
+            for ax, (row, col) in zip(axes_list, positions):
+                key = (axis, 0 if share == 'all' else group(row, col))
+
+                if key not in leaders.keys():
+                    leaders[key] = ax
+                elif axis == 'x' and not ax.get_shared_x_axes().joined(ax, leaders[key]):
+                    ax.sharex(leaders[key])
+                elif axis == 'y' and not ax.get_shared_y_axes().joined(ax, leaders[key]):
+                    ax.sharey(leaders[key])
+
+    leader_axes = set(id(ax) for ax in leaders.values())
+
+    handles = get_legend_handles(options) if options['legend'] and options['grid_legend'] == 'each' else None
+
+    timer.lap('setup')
+
+    for i, (ax, (row, col)) in enumerate(zip(axes_list, positions)):
+        ax_options = dict(options, **overrides[i]) if overrides[i] else options
+
+        inner = {}
+        if options['sharex'] and ax.get_subplotspec().rowspan.stop < nrows:
+            inner.update({'hide_x_labels': True, 'hide_x_ticklabels': True})
+        if options['sharey'] and col > 0:
+            inner.update({'hide_y_labels': True, 'hide_y_ticklabels': True})
+
+        if inner:
+            ax_options = dict(ax_options, **inner)
+
+        adjust_labels(ax=ax, options=ax_options)
+
+        # Shared axes get their locators from the first Axes-object in the group
+        adjust_ticks(ax=ax, options=ax_options, set_x_locators=not options['sharex'] or id(ax) in leader_axes or 'x_tick_locators' in overrides[i], set_y_locators=not options['sharey'] or id(ax) in leader_axes or 'y_tick_locators' in overrides[i])
+
+        if options['grid_legend'] == 'each':
+            legend_overridden = any(key in overrides[i] for key in ('legend', 'labels', 'markers', 'colours', 'palettes', 'marker_edges'))
+            adjust_legend(ax=ax, options=ax_options, handles=None if legend_overridden else handles)
+
+        if ax_options['xlim'] is not None:
+            ax.set_xlim(ax_options['xlim'])
+
+        if ax_options['ylim'] is not None:
+            ax.set_ylim(ax_options['ylim'])
+
+        if ax_options['backgrounds'] is not None and len(ax_options['backgrounds']) > 0:
+            draw_backgrounds(ax=ax, backgrounds=ax_options['backgrounds'], xlim_reset=ax_options['xlim_reset'], ylim_reset=ax_options['ylim_reset'])
+
+        if ax_options['text']:
+            draw_text(ax=ax, text=ax_options['text'])
+
+    timer.lap('axes')
+
+    if options['legend'] and options['grid_legend'] == 'figure':
+        for legend in fig.legends:
+            legend.remove()
+
+        fig.legend(*get_legend_handles(options), frameon=False, loc=options['legend_position'][0], bbox_to_anchor=options['legend_position'][1], ncol=options['legend_ncol'])
+
+    # Figure-level settings are only applied once
+    fig.subplots_adjust(**options['subplots_adjust'])
+
+    timer.lap('figure')
+    timer.finish()
+
+    return fig, axes
+
+
+
+@draft.recordable
+def adjust_labels(ax, options):
+    ''' Sets (or hides) the labels of the x- and y-axes of ax from options (see get_default_adjust_options)'''
+
     if not options['hide_y_labels']:
         if not options['yunit']:
             ax.set_ylabel(f'{options["ylabel"]}', labelpad=options['ylabel_pad']) 
@@ -138,15 +453,21 @@ def adjust_plot(fig, ax, options):
             ax.set_xlabel(f'{options["xlabel"]} [{options["xunit"]}]', labelpad=options['xlabel_pad'])
     else:
         ax.set_xlabel('')
-        
+
+
+
+@draft.recordable
+def adjust_ticks(ax, options, set_x_locators=True, set_y_locators=True):
+    ''' Sets the tick locators, tick parameters, ticklabel rotation and title of ax from options (see get_default_adjust_options). Locators can be skipped for axes that share their locators with another Axes-object.'''
+
     # Set multiple locators
-    if options['y_tick_locators']:
-        ax.yaxis.set_major_locator(MultipleLocator(options['y_tick_locators'][0]))
-        ax.yaxis.set_minor_locator(MultipleLocator(options['y_tick_locators'][1]))
+    if options['y_tick_locators'] and set_y_locators:
+        ax.yaxis.set_major_locator(mticker.MultipleLocator(options['y_tick_locators'][0]))
+        ax.yaxis.set_minor_locator(mticker.MultipleLocator(options['y_tick_locators'][1]))
 
-    if options['x_tick_locators']:
-        ax.xaxis.set_major_locator(MultipleLocator(options['x_tick_locators'][0]))
-        ax.xaxis.set_minor_locator(MultipleLocator(options['x_tick_locators'][1]))
+    if options['x_tick_locators'] and set_x_locators:
+        ax.xaxis.set_major_locator(mticker.MultipleLocator(options['x_tick_locators'][0]))
+        ax.xaxis.set_minor_locator(mticker.MultipleLocator(options['x_tick_locators'][1]))
 
     
     # FIXME THIS NEEDS REWORK FOR IT TO FUNCTION PROPERLY!
@@ -160,15 +481,9 @@ def adjust_plot(fig, ax, options):
     # Hide x- and y- ticklabels
     if options['hide_y_ticklabels']:
         ax.tick_params(axis='y', direction='in', which='both', labelleft=False, labelright=False)
-    else:
-        plt.xticks(rotation=options['rotation_x_ticks'])
-        #ax.set_xticklabels(ax.get_xticks(), rotation = options['rotation_x_ticks'])
 
     if options['hide_x_ticklabels']:
         ax.tick_params(axis='x', direction='in', which='both', labelbottom=False, labeltop=False)
-    else:
-        pass
-        #ax.set_yticklabels(ax.get_yticks(), rotation = options['rotation_y_ticks'])
 
 
     # Hide x- and y-ticks:
@@ -182,134 +497,284 @@ def adjust_plot(fig, ax, options):
     else:
         ax.tick_params(axis='x', direction=options['x_tick_params']['direction'], which=options['x_tick_params']['which'], top=options['x_tick_params']['top'], bottom=options['x_tick_params']['bottom'])
 
+    # Rotate the x- and y-ticklabels
+    for axis, key in (('x', 'rotation_x_ticks'), ('y', 'rotation_y_ticks')):
+        if options[key]:
+            ax.tick_params(axis=axis, labelrotation=options[key])
+
 
           
     # Set title
     if options['title']:
         ax.set_title(options['title'], fontsize=plt.rcParams['font.size'])
 
-     
 
-    #### DRAW/REMOVE LEGEND ####
-    # Options:
-    # 'legend_position': (default ['lower center', (0.5, -0.1)]) - Follows matplotlib's way of specifying legend position
-    # 'legend_ncol': (default 1) # Number of columns to write the legend in
-    # Also requires options to contain values in colours, markers and labels. (No defaults)
+
+@draft.recordable
+def adjust_legend(ax, options, handles=None):
+    ''' Removes any legend from ax, and draws a new one if options['legend'] is True. handles can be passed as returned by get_legend_handles, to reuse them for several Axes-objects.'''
 
     if ax.get_legend():
         ax.get_legend().remove()
 
 
     if options['legend']:
-        # Make palette and linestyles from original parameters
-        if not options['colours']:
-            colours = col.generate_colours(palettes=options['palettes'])
-        else:
-            colours = itertools.cycle(options['colours'])
-        
+        active_markers, active_labels = handles if handles is not None else get_legend_handles(options)
 
-        markers = itertools.cycle(options['markers'])
-        
-        # Create legend
-        active_markers = []
-        active_labels = []
+        ax.legend(active_markers, active_labels, frameon=False, loc=options['legend_position'][0], bbox_to_anchor=options['legend_position'][1], ncol=options['legend_ncol'])
+        #fig.legend(handles=patches, loc=options['legend_position'][0], bbox_to_anchor=options['legend_position'][1], frameon=False)
+
+
+
+def get_legend_handles(options):
+    ''' Returns the legend handles and labels made from options['labels'], options['markers'] and options['colours'] (or options['palettes']). Labels that are '_' are skipped along with their colour and marker.'''
+
+    # Make palette and linestyles from original parameters
+    if options['colours'] is None or len(options['colours']) == 0:
+        colours = col.generate_colours(palettes=options['palettes'])
+    else:
+        colours = itertools.cycle(options['colours'])
+    
+
+    markers = itertools.cycle(options['markers'])
+    
+    # Create legend
+    active_markers = []
+    active_labels = []
 
-        for label in options['labels']:
+    for label in options['labels']:
 
 
-            # Discard next linestyle and colour if label is _
-            if label == '_':
-                _ = next(colours)
-                _ = next(markers)
+        # Discard next linestyle and colour if label is _
+        if label == '_':
+            _ = next(colours)
+            _ = next(markers)
 
+        else:
+            marker = next(markers)
+            if not marker:
+                active_markers.append(mlines.Line2D([], [], color=next(colours)))
             else:
-                marker = next(markers)
-                if not marker:
-                    active_markers.append(Line2D([], [], color=next(colours)))
-                else:
-                    active_markers.append(Line2D([], [], markerfacecolor=next(colours), markeredgecolor=options['marker_edges'], markersize=10, color=(1,1,1,0), marker=marker))
-                
-                active_labels.append(label)
+                active_markers.append(mlines.Line2D([], [], markerfacecolor=next(colours), markeredgecolor=options['marker_edges'], markersize=10, color=(1,1,1,0), marker=marker))
+            
+            active_labels.append(label)
+
+    return active_markers, active_labels
+
+
+
+def _get_overrides(per_axis_overrides, axes, positions):
+    ''' Returns a list with the dictionary of overriding options (or an empty one) for every Axes-object in axes.flat'''
+
+    overrides = [{} for position in positions]
+
+    if per_axis_overrides is None:
+        return overrides
+
+    if isinstance(per_axis_overrides, dict):
+        for key, override in per_axis_overrides.items():
+            i = positions.index(tuple(key)) if isinstance(key, tuple) else key
+            overrides[i] = override or {}
+
+    else:
+        flat = np.array(per_axis_overrides, dtype=object).reshape(-1)
+
+        for i, override in enumerate(flat):
+            overrides[i] = override or {}
 
+    return overrides
+
+
+
+@draft.recordable
+def draw_backgrounds(ax, backgrounds, xlim_reset=False, ylim_reset=False):
+    ''' Draws rectangular backgrounds on ax. backgrounds is a dictionary or a list of dictionaries with the options below, or an array or list of (start, end)-intervals along the x-axis, which is drawn with the default options.
+    
+    'xlim' and 'ylim' can be a single (start, end)-pair or an array of pairs, so that any number of regions can be drawn from one dictionary. A start or end that is None is set to the current limit of the axis.
+    If 'span' is True and 'ylim' is not passed, the backgrounds span the full height of the Axes-object regardless of later changes to its y-limits.
     
+    All backgrounds with the same zorder are drawn as a single collection, so the drawing cost stays nearly constant with the number of regions.'''
+
+    default_background_options = {
+        'colour': (0,0,0),
+        'alpha': 0.2,
+        'xlim': None, # Defaults to the current x-limits
+        'ylim': None, # Defaults to the current y-limits, or the full height of the Axes-object if span is True
+        'span': False,
+        'zorder': 0,
+        'edgecolour': None,
+        'linewidth': None
+    }
 
-        ax.legend(active_markers, active_labels, frameon=False, loc=options['legend_position'][0], bbox_to_anchor=options['legend_position'][1], ncol=options['legend_ncol'])
-        #fig.legend(handles=patches, loc=options['legend_position'][0], bbox_to_anchor=options['legend_position'][1], frameon=False)
+    if isinstance(backgrounds, dict):
+        backgrounds = [backgrounds]
+    elif not isinstance(backgrounds, list) or not all(isinstance(background, dict) for background in backgrounds):
+        # An array or (nested) list of intervals, e.g. loaded from JSON
+        backgrounds = [{'xlim': backgrounds}]
 
-        
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
 
-    # Adjust where the axes start within the figure. Default value is 10% in from the left and bottom edges. Used to make room for the plot within the figure size (to avoid using bbox_inches='tight' in the savefig-command, as this screws with plot dimensions)
-    plt.subplots_adjust(**options['subplots_adjust'])
+    # Rectangles are collected per zorder and per coordinate system (data or spanning the Axes-object) and drawn together
+    groups = {}
 
+    for background in backgrounds:
+        background = aux.update_options(options=dict(background), default_options=default_background_options)
 
-    # If limits for x- and y-axes is passed, sets these.
-    if options['xlim'] is not None:
-        ax.set_xlim(options['xlim'])
+        x = _get_intervals(xlim if xlim_reset or background['xlim'] is None else background['xlim'], xlim)
 
-    if options['ylim'] is not None:
-        ax.set_ylim(options['ylim'])
+        span = background['span'] and background['ylim'] is None and not ylim_reset
 
+        if span:
+            y = np.tile([0., 1.], (len(x), 1))
+        else:
+            y = _get_intervals(ylim if ylim_reset or background['ylim'] is None else background['ylim'], ylim)
 
-    #### DRAW BACKGROUNDS ####
-    # options['backgrounds'] should contain a dictionary or a list of dictionaries. Options to be specified are listed below.
+        x, y = np.broadcast_arrays(x, y)
 
-    if options['backgrounds']:
+        edgecolour = background['edgecolour']
+        if edgecolour is None:
+            edgecolour = plt.rcParams['patch.edgecolor'] if plt.rcParams['patch.force_edgecolor'] else 'none'
 
-        if not isinstance(options['backgrounds'], list):
-            options['backgrounds'] = [options['backgrounds']]
+        linewidth = background['linewidth'] if background['linewidth'] is not None else plt.rcParams['patch.linewidth']
 
+        group = groups.setdefault((background['zorder'], span), {'x': [], 'y': [], 'facecolours': [], 'edgecolours': [], 'linewidths': []})
+        group['x'].append(x)
+        group['y'].append(y)
+        group['facecolours'] += [(background['colour'][0], background['colour'][1], background['colour'][2], background['alpha'])] * len(x)
+        group['edgecolours'] += [edgecolour] * len(x)
+        group['linewidths'] += [linewidth] * len(x)
 
-        for background in options['backgrounds']:
-            default_background_options = {
-                'colour': (0,0,0),
-                'alpha': 0.2,
-                'xlim': list(ax.get_xlim()),
-                'ylim': list(ax.get_ylim()),
-                'zorder': 0,
-                'edgecolour': None,
-                'linewidth': None
-            }
 
+    for (zorder, span), group in groups.items():
+        x, y = np.concatenate(group['x']), np.concatenate(group['y'])
 
-            background = aux.update_options(options=background, default_options=default_background_options)
+        # Corners of all rectangles, shape (N, 4, 2)
+        vertices = np.stack([np.stack([x[:,0], y[:,0]], axis=-1), np.stack([x[:,1], y[:,0]], axis=-1), np.stack([x[:,1], y[:,1]], axis=-1), np.stack([x[:,0], y[:,1]], axis=-1)], axis=1)
 
-            if options['xlim_reset']:
-                background['xlim'] = list(ax.get_xlim())
-            if options['ylim_reset']:
-                background['ylim'] = list(ax.get_ylim())
+        collection = mcollections.PolyCollection(vertices, facecolors=group['facecolours'], edgecolors=group['edgecolours'], linewidths=group['linewidths'], zorder=zorder)
 
-            if not background['xlim'][0]:
-                background['xlim'][0] = ax.get_xlim()[0]
-            if not background['xlim'][1]:
-                background['xlim'][1] = ax.get_xlim()[1]
-            if not background['ylim'][0]:
-                background['ylim'][0] = ax.get_ylim()[0]
-            if not background['ylim'][1]:
-                background['ylim'][1] = ax.get_ylim()[1]
-            
-            ax.add_patch(Rectangle(
-                                    xy=(background['xlim'][0], background['ylim'][0]),                                                      # Anchor point
-                                    width=background['xlim'][1]-background['xlim'][0],                                                      # Width of background
-                                    height=background['ylim'][1]-background['ylim'][0],                                                     # Height of background
-                                    zorder=background['zorder'],                                                                            # Placement in stack 
-                                    facecolor=(background['colour'][0], background['colour'][1], background['colour'][2], background['alpha']), # Colour
-                                    edgecolor=background['edgecolour'],                                                                     # Edgecolour
-                                    linewidth=background['linewidth'])                                                                      # Linewidth 
-                        )
+        if span:
+            collection.set_transform(ax.get_xaxis_transform())
 
+        ax.add_collection(collection, autolim=not span)
 
-    # Add custom text
-    if options['text']:
 
-        # If only a single element, put it into a list so the below for-loop works.
-        if isinstance(options['text'][0], str):
-            options['text'] = [options['text']]
 
-        # Plot all passed texts
-        for text in options['text']:
-            ax.text(x=text[1][0], y=text[1][1], s=text[0])
-    
-    return fig, ax
+def _get_intervals(limits, default):
+    ''' Returns limits as an (N, 2) array of intervals, where missing starts and ends (None or NaN) are set from default'''
+
+    intervals = np.array(limits, dtype=float).reshape(-1, 2)
+
+    intervals[:,0] = np.where(np.isnan(intervals[:,0]), default[0], intervals[:,0])
+    intervals[:,1] = np.where(np.isnan(intervals[:,1]), default[1], intervals[:,1])
+
+    return intervals
+
+
+
+@draft.recordable
+def draw_text(ax, text):
+    ''' Adds text to ax. text can be:
+        - a list where the first element is the string and the second is a tuple with x- and y-coordinates
+        - a list of such lists
+        - a dictionary with 'strings' and 'positions' (a list or (N, 2)-array of coordinates), to add many strings at once. Any other keys (e.g. 'fontsize', 'color', 'ha') are passed on to every text,
+          and 'transform' can be set to 'axes' to give the positions as fractions of the Axes-object.'''
+
+    if isinstance(text, dict):
+        kwargs = {key: val for key, val in text.items() if key not in ('strings', 'positions', 'transform')}
+
+        if 'transform' in text.keys():
+            kwargs['transform'] = ax.transAxes if text['transform'] == 'axes' else text['transform']
+
+        positions = np.asarray(text['positions'], dtype=float).reshape(-1, 2)
+
+        for string, (x, y) in zip(text['strings'], positions.tolist()):
+            ax.text(x=x, y=y, s=string, **kwargs)
+
+        return
+
+    # If only a single element, put it into a list so the below for-loop works.
+    if isinstance(text[0], str):
+        text = [text]
+
+    # Plot all passed texts
+    for t in text:
+        ax.text(x=t[1][0], y=t[1][1], s=t[0])
+
+
+
+@draft.recordable
+def plot_many(ax, x, Y, options={}, **kwargs):
+    ''' Plots many series on ax as a few collections instead of one artist per series. Y is a 2-D array with one series per row, or a list of series of different lengths.
+    x is either shared by all series (1-D), one per series (2-D array or list), or None to use the index of each series.
+
+    Series are given colours and markers in the same order as the legend of adjust_plot, so passing the same options (colours or palettes, markers and labels) with 'legend': True gives a matching legend.
+    Series without a marker are drawn as lines in a single LineCollection, and series with a marker as points in one PathCollection per marker. Any keyword arguments are passed on to the LineCollection.
+
+    Returns a list of the collections that were added.'''
+
+    default_options = {
+        'colours': None, 'palettes': None, # Colours of the series in order, or palettes to take them from (see colours.generate_colours). Defaults to matplotlib's colour cycle.
+        'markers': [None], # Markers of the series in order, repeated if there are more series. A series with marker None is drawn as a line.
+        'marker_edges': None, # Edge colour of the markers, as in the legend of adjust_plot
+        'markersize': 10, # Size of the markers in points, as in the legend of adjust_plot
+        'linewidth': None, # Defaults to rcParams['lines.linewidth']
+        'zorder': 2,
+    }
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    timer = inst.stages('plot_many', options)
+
+    if isinstance(Y, np.ndarray) and Y.ndim == 2:
+        xs = np.broadcast_to(np.arange(Y.shape[1]) if x is None else np.asarray(x), Y.shape)
+        series = list(zip(xs, Y))
+    else:
+        if x is None:
+            xs = [np.arange(len(y)) for y in Y]
+        elif isinstance(x, np.ndarray) and x.ndim == 1 and np.issubdtype(x.dtype, np.number):
+            xs = [x] * len(Y)
+        else:
+            xs = x
+
+        series = [(np.asarray(xi), np.asarray(y)) for xi, y in zip(xs, Y)]
+
+    colours = col.get_colour_array(number_of_colours=len(series), colours=options['colours'], palettes=options['palettes'])
+    markers = [options['markers'][i % len(options['markers'])] for i in range(len(series))]
+
+    timer.lap('styles')
+
+    collections = []
+
+    lines = [i for i, marker in enumerate(markers) if not marker]
+
+    if lines:
+        if isinstance(Y, np.ndarray) and Y.ndim == 2:
+            # All series have the same length, so the segments can be passed as a single (N, M, 2)-array
+            segments = np.stack([xs[lines], Y[lines]], axis=-1)
+        else:
+            segments = [np.column_stack(series[i]) for i in lines]
+
+        collection = mcollections.LineCollection(segments, colors=colours[lines], linewidths=options['linewidth'], zorder=options['zorder'], **kwargs)
+        ax.add_collection(collection)
+        collections.append(collection)
+
+    for marker in dict.fromkeys(marker for marker in markers if marker):
+        points = [i for i, m in enumerate(markers) if m == marker]
+
+        x_points = np.concatenate([series[i][0] for i in points])
+        y_points = np.concatenate([series[i][1] for i in points])
+        point_colours = np.repeat(colours[points], [len(series[i][1]) for i in points], axis=0)
+
+        collection = ax.scatter(x_points, y_points, s=options['markersize']**2, c=point_colours, marker=marker, edgecolors=options['marker_edges'], zorder=options['zorder'])
+        collections.append(collection)
+
+    ax.autoscale_view()
+
+    timer.lap('collections')
+    timer.finish()
+
+    return collections
 
 
 def determine_width(format_params):
@@ -357,6 +822,7 @@ def update_rc_params(rc_params):
         for key in rc_params.keys():
             plt.rcParams.update({key: rc_params[key]})
 
+@draft.recordable
 def prepare_inset_axes(parent_ax, options):
     
     default_options = {
@@ -380,44 +846,48 @@ def prepare_inset_axes(parent_ax, options):
 
     options = aux.update_options(options=options, required_options=default_options.keys(), default_options=default_options)
 
+    timer = inst.stages('prepare_inset_axes', options)
 
     # Create a set of inset Axes: these should fill the bounding box allocated to
     # them.
-    inset_ax = plt.axes(options["inset_bounding_box"])
+    inset_ax = parent_ax.get_figure().add_axes(options["inset_bounding_box"])
     # Manually set the position and relative size of the inset axes within ax1
-    ip = InsetPosition(parent_ax, options['inset_position'])
+    ip = inset_locator.InsetPosition(parent_ax, options['inset_position'])
     inset_ax.set_axes_locator(ip)
 
+    timer.lap('axes')
+
     if options['connecting_corners'] and len(options["connecting_corners"]) == 2:
         connect_inset(parent_ax, inset_ax, loc1a=options['connecting_corners'][0], loc2a=options['connecting_corners'][1], loc1b=options['connecting_corners'][0], loc2b=options['connecting_corners'][1], fc='none', ec='black')
     elif options['connecting_corners'] and len(options['connecting_corners']) == 4:
         connect_inset(parent_ax, inset_ax, loc1a=options['connecting_corners'][0], loc2a=options['connecting_corners'][1], loc1b=options['connecting_corners'][2], loc2b=options['connecting_corners'][3], fc='none', ec='black', ls='--')
     
-    inset_ax.xaxis.set_major_locator(MultipleLocator(options['inset_x_tick_locators'][0]))
-    inset_ax.xaxis.set_minor_locator(MultipleLocator(options['inset_x_tick_locators'][1]))
+    inset_ax.xaxis.set_major_locator(mticker.MultipleLocator(options['inset_x_tick_locators'][0]))
+    inset_ax.xaxis.set_minor_locator(mticker.MultipleLocator(options['inset_x_tick_locators'][1]))
 
     
-    inset_ax.yaxis.set_major_locator(MultipleLocator(options['inset_y_tick_locators'][0]))
-    inset_ax.yaxis.set_minor_locator(MultipleLocator(options['inset_y_tick_locators'][1]))
-   
+    inset_ax.yaxis.set_major_locator(mticker.MultipleLocator(options['inset_y_tick_locators'][0]))
+    inset_ax.yaxis.set_minor_locator(mticker.MultipleLocator(options['inset_y_tick_locators'][1]))
 
-    
+    timer.lap('connectors_and_ticks')
+    timer.finish()
     
     return inset_ax
 
 
 
 
+@draft.recordable
 def connect_inset(parent_axes, inset_axes, loc1a=1, loc1b=1, loc2a=2, loc2b=2, **kwargs):
-    rect = TransformedBbox(inset_axes.viewLim, parent_axes.transData)
+    rect = mtransforms.TransformedBbox(inset_axes.viewLim, parent_axes.transData)
 
-    pp = BboxPatch(rect, fill=False, **kwargs)
+    pp = inset_locator.BboxPatch(rect, fill=False, **kwargs)
     parent_axes.add_patch(pp)
 
-    p1 = BboxConnector(inset_axes.bbox, rect, loc1=loc1a, loc2=loc1b, **kwargs)
+    p1 = inset_locator.BboxConnector(inset_axes.bbox, rect, loc1=loc1a, loc2=loc1b, **kwargs)
     inset_axes.add_patch(p1)
     p1.set_clip_on(False)
-    p2 = BboxConnector(inset_axes.bbox, rect, loc1=loc2a, loc2=loc2b, **kwargs)
+    p2 = inset_locator.BboxConnector(inset_axes.bbox, rect, loc1=loc2a, loc2=loc2b, **kwargs)
     inset_axes.add_patch(p2)
     p2.set_clip_on(False)
 
@@ -0,0 +1,264 @@
+import plotter.auxillary as aux
+import plotter.plots as plots
+
+import collections
+import contextlib
+import copy
+import threading
+
+# Imported the first time they are used (see aux.lazy_import)
+plt = aux.lazy_import('matplotlib.pyplot')
+maxis = aux.lazy_import('matplotlib.axis')
+mticker = aux.lazy_import('matplotlib.ticker')
+mtransforms = aux.lazy_import('matplotlib.transforms')
+
+
+POOL_MAX_FIGURES = 16 # Maximum number of idle figures kept in the pool
+POOL_MAX_BYTES = 512 * 1024**2 # Maximum estimated memory of the idle figures kept in the pool
+
+_pool = collections.OrderedDict() # key -> list of pooled figures, least recently used key first
+_pool_lock = threading.Lock()
+_acquired = {} # id(fig) -> pooled figure, for the figures currently handed out. Guarded by _pool_lock, like _pool.
+
+
+def acquire_figure(options={}):
+    ''' Returns fig, ax (or fig, axes for grids) like prepare_plot, but reuses a figure released with release_figure if one with the same rc_params, resolved format_params and options['pyplot'] is available.
+
+    Reused figures are cleared of everything drawn on them (artists, labels, legends, inset axes, limits, locators and tick parameters), and are ready to use as if fresh from prepare_plot.
+    Pass the figure to release_figure when it has been saved, or use pooled_figure as a context manager.'''
+
+    style = plots.compile_style(options)
+    key = (style.key[0], aux.freeze(style.format_params), options.get('pyplot', True) is not False)
+
+    pooled = None
+
+    with _pool_lock:
+        if key in _pool and _pool[key]:
+            pooled = _pool[key].pop()
+
+            if not _pool[key]:
+                del _pool[key]
+
+            _acquired[id(pooled['fig'])] = pooled
+
+    if pooled:
+        # Copied as in prepare_plot, so that changes to the options do not change the cached style
+        if 'format_params' in options.keys():
+            options['format_params'].update(copy.deepcopy(style.format_params))
+
+        plots.apply_style(style)
+        _reset_figure(pooled)
+
+    else:
+        fig, axes = plots.prepare_plot(options)
+        pooled = {'key': key, 'fig': fig, 'axes': axes, 'state': _get_state(fig, axes), 'bytes': _estimate_bytes(fig)}
+
+        with _pool_lock:
+            _acquired[id(pooled['fig'])] = pooled
+
+    return pooled['fig'], pooled['axes']
+
+
+
+def release_figure(fig):
+    ''' Returns a figure from acquire_figure to the pool, unsharing any axes shared while it was in use. If the pool is full, the least recently used figures are closed.'''
+
+    with _pool_lock:
+        pooled = _acquired.pop(id(fig), None)
+
+    if pooled is None:
+        raise ValueError('The figure was not acquired from the pool.')
+
+    _unshare_axes(_get_axes_list(pooled['axes']))
+
+    with _pool_lock:
+        _pool.setdefault(pooled['key'], []).append(pooled)
+        _pool.move_to_end(pooled['key'])
+
+        evicted = _evict()
+
+    for pooled in evicted:
+        plt.close(pooled['fig'])
+
+
+
+@contextlib.contextmanager
+def pooled_figure(options={}):
+    ''' Context manager around acquire_figure and release_figure:
+
+    with pooled_figure(options) as (fig, ax):
+        ...
+        fig.savefig(path)
+    '''
+
+    fig, axes = acquire_figure(options)
+
+    try:
+        yield fig, axes
+    finally:
+        release_figure(fig)
+
+
+
+def clear_pool():
+    ''' Closes all idle figures in the pool'''
+
+    with _pool_lock:
+        evicted = [pooled for figures in _pool.values() for pooled in figures]
+        _pool.clear()
+
+    for pooled in evicted:
+        plt.close(pooled['fig'])
+
+
+
+def pool_info():
+    ''' Returns the number of idle figures in the pool and their estimated memory in bytes'''
+
+    with _pool_lock:
+        figures = [pooled for figures in _pool.values() for pooled in figures]
+        acquired = len(_acquired)
+
+    return {'figures': len(figures), 'bytes': sum(pooled['bytes'] for pooled in figures), 'acquired': acquired}
+
+
+
+def _evict():
+
+    evicted = []
+
+    number_of_figures = sum(len(figures) for figures in _pool.values())
+    number_of_bytes = sum(pooled['bytes'] for figures in _pool.values() for pooled in figures)
+
+    while _pool and (number_of_figures > POOL_MAX_FIGURES or number_of_bytes > POOL_MAX_BYTES):
+        key = next(iter(_pool))
+        pooled = _pool[key].pop(0)
+
+        if not _pool[key]:
+            del _pool[key]
+
+        number_of_figures -= 1
+        number_of_bytes -= pooled['bytes']
+        evicted.append(pooled)
+
+    return evicted
+
+
+
+def _estimate_bytes(fig):
+    ''' Estimates the memory of a figure from the size of its RGBA-buffer when drawn'''
+
+    width, height = fig.get_size_inches() * fig.dpi
+
+    return int(width * height * 4)
+
+
+
+def _get_axes_list(axes):
+
+    return list(axes.flat) if hasattr(axes, 'flat') else [axes]
+
+
+
+def _unshare_axes(axes):
+    ''' Removes the links between shared x- and y-axes (e.g. from adjust_grid), so that they do not carry over to the next user of the figure'''
+
+    for ax in axes:
+        for name, axis in (('x', ax.xaxis), ('y', ax.yaxis)):
+            grouper = ax._shared_axes[name]
+
+            if len(grouper.get_siblings(ax)) > 1:
+                grouper.remove(ax)
+
+                # Shared axes also share their locators and formatters
+                axis.major, axis.minor = maxis.Ticker(), maxis.Ticker()
+
+        ax._sharex = ax._sharey = None
+
+
+
+def _get_state(fig, axes):
+    ''' Records the parts of a fresh figure that are not reset by clearing the artists'''
+
+    state = {
+        'subplotpars': {attr: getattr(fig.subplotpars, attr) for attr in ('left', 'right', 'top', 'bottom', 'wspace', 'hspace')},
+        'axes': [],
+    }
+
+    for ax in _get_axes_list(axes):
+        state['axes'].append({
+            'position': ax.get_position(original=True).frozen(),
+            'facecolor': ax.get_facecolor(),
+            'spines': {name: spine.get_visible() for name, spine in ax.spines.items()},
+            'xaxis': {which: ax.xaxis.get_tick_params(which=which) for which in ('major', 'minor')},
+            'yaxis': {which: ax.yaxis.get_tick_params(which=which) for which in ('major', 'minor')},
+        })
+
+    return state
+
+
+
+def _reset_figure(pooled):
+    ''' Brings a used figure back to the state it had when created by prepare_plot, without recreating its Axes-objects'''
+
+    fig, state = pooled['fig'], pooled['state']
+    axes = _get_axes_list(pooled['axes'])
+
+    # Remove any additional axes, e.g. insets
+    for ax in list(fig.axes):
+        if ax not in axes:
+            ax.remove()
+
+    # The figure keeps a reference to its suptitle, supxlabel and supylabel to reuse them, so these are emptied rather than removed
+    suplabels = [getattr(fig, name, None) for name in ('_suptitle', '_supxlabel', '_supylabel')]
+
+    for artist in fig.texts + fig.legends + fig.patches + fig.lines + fig.images:
+        if any(artist is suplabel for suplabel in suplabels):
+            artist.set_text('')
+        else:
+            artist.remove()
+
+    fig.subplots_adjust(**state['subplotpars'])
+
+    for ax, ax_state in zip(axes, state['axes']):
+        for artist in ax.lines + ax.collections + ax.patches + ax.texts + ax.images + ax.tables + ax.artists:
+            artist.remove()
+
+        if ax.get_legend():
+            ax.get_legend().remove()
+
+        ax.set_title('')
+        ax.set_xlabel('')
+        ax.set_ylabel('')
+        ax.set_prop_cycle(None)
+
+        ax.set_position(ax_state['position'])
+        ax.set_facecolor(ax_state['facecolor'])
+        ax.set_axis_on()
+        ax.set_aspect('auto')
+
+        for name, visible in ax_state['spines'].items():
+            ax.spines[name].set_visible(visible)
+
+        if ax.get_xscale() != 'linear':
+            ax.set_xscale('linear')
+        if ax.get_yscale() != 'linear':
+            ax.set_yscale('linear')
+
+        for axis, name in ((ax.xaxis, 'xaxis'), (ax.yaxis, 'yaxis')):
+            axis.set_major_locator(mticker.AutoLocator())
+            axis.set_minor_locator(mticker.NullLocator())
+            axis.set_major_formatter(mticker.ScalarFormatter())
+            axis.set_minor_formatter(mticker.NullFormatter())
+
+            for which in ('major', 'minor'):
+                axis.set_tick_params(which=which, reset=True, **ax_state[name][which])
+
+            axis.label.set_visible(True)
+
+        # Forget the data limits, so the next plot autoscales as on a fresh Axes-object
+        ax.dataLim.set_points(mtransforms.Bbox.null().get_points())
+        ax.ignore_existing_data_limits = True
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        ax.set_autoscale_on(True)
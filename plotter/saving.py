@@ -0,0 +1,232 @@
+import plotter.auxillary as aux
+import plotter.batch as batch
+import plotter.instrumentation as inst
+
+import os
+import pickle
+import threading
+
+# Imported the first time they are used (see aux.lazy_import)
+asyncio = aux.lazy_import('asyncio')
+futures = aux.lazy_import('concurrent.futures')
+plt = aux.lazy_import('matplotlib.pyplot')
+mstyle = aux.lazy_import('matplotlib.style.core')
+
+
+# Keyword arguments of fig.savefig() that default to rcParams, and are resolved when a figure is submitted, so that a later change of rcParams does not change how it is saved
+SAVEFIG_RC_PARAMS = {'dpi': 'savefig.dpi', 'facecolor': 'savefig.facecolor', 'edgecolor': 'savefig.edgecolor', 'transparent': 'savefig.transparent', 'bbox_inches': 'savefig.bbox', 'pad_inches': 'savefig.pad_inches'}
+
+
+class SaveQueue:
+    ''' Saves figures in the background, so that the next figure can be built while the previous ones are rasterised and encoded:
+
+    with saving.SaveQueue({'max_in_flight': 4}) as queue:
+        for data in datasets:
+            fig, ax = plots.prepare_plot(options)
+            ...
+            queue.submit(fig, path)
+
+    From a coroutine, use await queue.submit_async(fig, path) instead, which waits for a free slot without blocking the event loop.
+
+    Options:
+        'executor': 'thread' (default) saves in a thread of this process. The figure must not be changed after it is submitted. The savefig-rcParams (savefig.dpi, savefig.bbox etc.) are taken when the figure is submitted,
+                    but rcParams read while drawing (e.g. from rc_params for fonts or paths) are read from the global rcParams while the figure is saved, so these must not differ between the queued figures.
+                    'process' pickles the figure when submitted and saves it in a worker process, so that saving is not limited by the GIL. The figure can be changed or closed right away.
+                    All rcParams are taken when the figure is submitted, and applied in the worker.
+        'workers': number of threads or processes saving figures
+        'max_in_flight': maximum number of figures submitted but not yet saved. submit blocks until a figure is saved when there are this many, which caps the memory used by waiting figures.
+        'close': whether figures are closed once they have been saved (or pickled, with the 'process' executor). pyplot is not thread-safe, so saved figures are closed on the submitting thread,
+                 the next time submit, wait or close is called, rather than by the thread that saved them.
+        'savefig_kwargs': keyword arguments passed on to fig.savefig() for every figure, unless overridden by the keyword arguments of submit'''
+
+    def __init__(self, options={}):
+
+        default_options = {
+            'executor': 'thread', # 'thread' or 'process'
+            'workers': 1,
+            'max_in_flight': 4,
+            'close': True,
+            'savefig_kwargs': {},
+        }
+
+        self.options = aux.update_options(options=dict(options), default_options=default_options)
+
+        if self.options['executor'] == 'thread':
+            self.executor = futures.ThreadPoolExecutor(max_workers=self.options['workers'], thread_name_prefix='plotter-save')
+        elif self.options['executor'] == 'process':
+            self.executor = futures.ProcessPoolExecutor(max_workers=self.options['workers'], initializer=batch._init_batch_worker)
+        else:
+            raise ValueError(f'Unknown executor {self.options["executor"]}. Use "thread" or "process".')
+
+        self.slots = threading.BoundedSemaphore(self.options['max_in_flight'])
+        self.pending = set()
+        self.errors = [] # Futures of figures that failed to save, until raised by wait
+        self.to_close = {} # Future -> figure, for figures to close on the submitting thread once saved
+        self.lock = threading.Lock()
+
+
+    def submit(self, fig, path, **kwargs):
+        ''' Queues fig to be saved to path. Blocks while options['max_in_flight'] figures are waiting to be saved. Returns a concurrent.futures.Future with path as its result once saved.'''
+
+        self.slots.acquire()
+
+        return self._submit(fig, path, kwargs)
+
+
+    async def submit_async(self, fig, path, **kwargs):
+        ''' Queues fig to be saved to path from a coroutine. Waits for a free slot without blocking the event loop. Returns an asyncio.Future with path as its result once saved.'''
+
+        if not self.slots.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self.slots.acquire))
+
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The thread can not be interrupted, so the slot it acquires is given back once it has it
+                acquiring.add_done_callback(lambda task: self.slots.release())
+                raise
+
+        return asyncio.wrap_future(self._submit(fig, path, kwargs))
+
+
+    def wait(self):
+        ''' Blocks until all queued figures are saved, and closes them if options['close'] is True. Raises the first error that occurred while saving, if any.'''
+
+        self._wait_pending()
+        self._close_saved()
+        self._raise_errors()
+
+
+    async def wait_async(self):
+        ''' Waits for all queued figures to be saved from a coroutine, without blocking the event loop. The saved figures are closed on the thread of the event loop.'''
+
+        await asyncio.to_thread(self._wait_pending)
+        self._close_saved()
+        self._raise_errors()
+
+
+    def close(self):
+        ''' Waits for all queued figures to be saved and stops the workers'''
+
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+            self._close_saved()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # Do not hide an exception from the with-block behind an error from saving
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True)
+            self._close_saved()
+
+
+    def _submit(self, fig, path, kwargs):
+
+        savefig_kwargs = dict(self.options['savefig_kwargs'], **kwargs)
+
+        for key, rc_param in SAVEFIG_RC_PARAMS.items():
+            savefig_kwargs.setdefault(key, plt.rcParams[rc_param])
+
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            self._close_saved()
+
+            if self.options['executor'] == 'process':
+                # Figures are pickled here rather than by the executor, so that they can be closed (or changed) as soon as submit returns
+                rc_params = {key: val for key, val in plt.rcParams.items() if key not in mstyle.STYLE_BLACKLIST}
+                future = self.executor.submit(_save_pickled, pickle.dumps(fig), path, savefig_kwargs, rc_params)
+
+                if self.options['close']:
+                    plt.close(fig)
+
+            else:
+                # Closed by _close_saved on the submitting thread, as pyplot must not be used from the saving thread
+                future = self.executor.submit(save_figure, fig, path, savefig_kwargs, False)
+
+        except BaseException:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.pending.add(future)
+
+            if self.options['close'] and self.options['executor'] == 'thread':
+                self.to_close[future] = fig
+
+        future.add_done_callback(self._done)
+
+        return future
+
+
+    def _wait_pending(self):
+
+        with self.lock:
+            pending = list(self.pending)
+
+        futures.wait(pending)
+
+
+    def _raise_errors(self):
+
+        with self.lock:
+            errors, self.errors = self.errors, []
+
+        if errors:
+            raise errors[0].exception()
+
+
+    def _close_saved(self):
+        ''' Closes the figures that have been saved (or failed to). Called on the submitting thread.'''
+
+        with self.lock:
+            saved = [future for future in self.to_close if future.done()]
+            figures = [self.to_close.pop(future) for future in saved]
+
+        for fig in figures:
+            plt.close(fig)
+
+
+    def _done(self, future):
+
+        with self.lock:
+            self.pending.discard(future)
+
+            if not future.cancelled() and future.exception() is not None:
+                self.errors.append(future)
+
+        self.slots.release()
+
+
+
+def save_figure(fig, path, savefig_kwargs={}, close=True):
+    ''' Saves fig to path, and closes it afterwards if close is True. Returns path.'''
+
+    try:
+        with inst.stage('savefig', {'path': path}):
+            fig.savefig(path, **savefig_kwargs)
+    finally:
+        if close:
+            plt.close(fig)
+
+    return path
+
+
+
+def _save_pickled(data, path, savefig_kwargs, rc_params):
+
+    # The worker only saves one figure at a time, so the rcParams of the submitting process can be applied globally
+    dict.update(plt.rcParams, rc_params)
+
+    # The unpickled copy belongs to the worker, and is always closed
+    return save_figure(pickle.loads(data), path, savefig_kwargs=savefig_kwargs, close=True)
@@ -0,0 +1,333 @@
+''' A long-lived local render service, so that scripts can render figures without starting Python and importing matplotlib for every figure.
+
+Start the service with:
+
+    python -m plotter.server --workers 4
+
+and submit jobs from any script:
+
+    import plotter.server as server
+    results = server.render([{'func': 'mypackage.plots:plot_spectrum', 'data': data, 'options': 'options.json', 'output': 'spectrum.png'}])
+
+The service keeps a pool of warm worker processes, with matplotlib imported, the font cache loaded and compiled styles cached, and renders every job like batch.render_job.
+
+Messages are pickled, so only processes that know the authkey can connect, in either direction. By default, the socket and a randomly generated authkey are kept in a folder only the current user can access
+($XDG_RUNTIME_DIR/plotter, or plotter-<uid> in the temporary folder), where the service writes the authkey when it starts and clients read it.'''
+
+import plotter.auxillary as aux
+import plotter.batch as batch
+
+import argparse
+import importlib
+import os
+import secrets
+import stat
+import tempfile
+import threading
+import traceback
+
+# Imported the first time they are used (see aux.lazy_import)
+connection = aux.lazy_import('multiprocessing.connection')
+futures = aux.lazy_import('concurrent.futures')
+
+
+def get_default_server_options():
+    ''' Returns the default options of the service and of the clients connecting to it'''
+
+    default_options = {
+        'address': None, # Path of the Unix socket (or name of the pipe on Windows). Defaults to $PLOTTER_SERVER_ADDRESS, or plotter.sock in the private folder.
+        'authkey': None, # Shared secret (bytes) that clients must know to connect. Defaults to the key in authkey_file.
+        'authkey_file': None, # File the service writes a random authkey to if it does not exist, and clients read it from. Defaults to plotter.key in the private folder.
+        'workers': None, # Number of worker processes rendering jobs. Defaults to the number of CPUs.
+        'load_func': None, # Called as load_func(data) in the worker to load the data of each job, e.g. from a path
+    }
+
+    return default_options
+
+
+
+def serve(options={}):
+    ''' Runs the render service until it is asked to shut down (see shutdown). Every client connection is handled in its own thread, and the jobs are rendered across a pool of worker processes that are started and warmed up before the first job.'''
+
+    # Copied, as the generated authkey is set in the options
+    options = _resolve_paths(aux.update_options(options=dict(options), default_options=get_default_server_options()))
+
+    if options['authkey'] is None:
+        options['authkey'] = _load_authkey(options['authkey_file'], create=True)
+
+    # A socket file left behind by a service that did not shut down cleanly would stop the listener from starting
+    if os.path.exists(options['address']) and not ping(options):
+        os.remove(options['address'])
+
+    listener = connection.Listener(options['address'], authkey=options['authkey'])
+
+    pool = {'workers': options['workers'] or os.cpu_count() or 1, 'lock': threading.Lock()}
+    pool['executor'] = _start_executor(pool['workers'])
+
+    stop = threading.Event()
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, connection.AuthenticationError):
+                # A client that failed the handshake, or disconnected during it
+                continue
+
+            # A shutdown request connects once more to wake up accept
+            if stop.is_set():
+                conn.close()
+                break
+
+            threading.Thread(target=_handle_connection, args=(conn, pool, stop, options), daemon=True).start()
+
+    finally:
+        listener.close()
+        pool['executor'].shutdown(wait=True)
+
+        if os.path.exists(options['address']):
+            os.remove(options['address'])
+
+
+
+def render(jobs, options={}):
+    ''' Sends jobs to the render service and waits for them to be rendered. jobs is a job or list of jobs as in batch.render_batch, where 'func' can also be given as a string 'module:function',
+    and 'options' can be a dictionary or a path to options saved with aux.save_options. The data is pickled, so it can be e.g. NumPy-arrays, or a path if the service was started with a load_func.
+
+    Returns the result (or list of results) of batch.render_job. The jobs of one call are rendered in parallel across the workers of the service.'''
+
+    options = _resolve_paths(aux.update_options(options=dict(options), default_options=get_default_server_options()))
+
+    single = isinstance(jobs, dict)
+
+    response = _request({'command': 'render', 'jobs': [jobs] if single else list(jobs)}, options)
+
+    return response['results'][0] if single else response['results']
+
+
+
+def ping(options={}):
+    ''' Returns whether a render service is running at options['address']'''
+
+    options = _resolve_paths(aux.update_options(options=dict(options), default_options=get_default_server_options()))
+
+    try:
+        return _request({'command': 'ping'}, options)['status'] == 'ok'
+    except (OSError, EOFError, connection.AuthenticationError):
+        return False
+
+
+
+def shutdown(options={}):
+    ''' Asks the render service to finish the jobs it is rendering and stop'''
+
+    options = _resolve_paths(aux.update_options(options=dict(options), default_options=get_default_server_options()))
+
+    _request({'command': 'shutdown'}, options)
+
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description='Runs a local plotter render service.')
+    parser.add_argument('--address', default=None, help='path of the Unix socket to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--authkey', default=None, help='shared secret clients must know to connect')
+    args = parser.parse_args(args)
+
+    options = {'workers': args.workers, 'authkey': args.authkey.encode() if args.authkey else None}
+
+    if args.address:
+        options['address'] = args.address
+
+    serve(options)
+
+
+
+def _request(message, options):
+
+    authkey = options['authkey'] if options['authkey'] is not None else _load_authkey(options['authkey_file'])
+
+    with connection.Client(options['address'], authkey=authkey) as conn:
+        conn.send(message)
+        response = conn.recv()
+
+    if response['status'] != 'ok':
+        raise RuntimeError(f'The render service failed to handle the request:\n{response["error"]}')
+
+    return response
+
+
+
+def _resolve_paths(options):
+    ''' Sets the address and authkey_file left as None to their defaults. These are resolved only when needed, as finding the private folder creates it.'''
+
+    if options['address'] is None:
+        options['address'] = os.environ.get('PLOTTER_SERVER_ADDRESS') or _get_default_address()
+
+    if options['authkey_file'] is None and options['authkey'] is None:
+        options['authkey_file'] = os.path.join(_get_private_folder(), 'plotter.key')
+
+    return options
+
+
+
+def _get_default_address():
+
+    if os.name == 'nt':
+        return r'\\.\pipe\plotter-server'
+
+    return os.path.join(_get_private_folder(), 'plotter.sock')
+
+
+
+def _get_private_folder():
+    ''' Returns a folder that only the current user can access, for the socket and authkey of the service. Raises a PermissionError if the folder exists but belongs to another user or can be accessed by others.'''
+
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        folder = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'plotter')
+    elif os.name == 'nt':
+        folder = os.path.join(tempfile.gettempdir(), 'plotter')
+    else:
+        folder = os.path.join(tempfile.gettempdir(), f'plotter-{os.getuid()}')
+
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+
+    _check_private(folder)
+
+    return folder
+
+
+
+def _check_private(path):
+
+    if os.name == 'nt':
+        return
+
+    info = os.lstat(path)
+
+    if info.st_uid != os.getuid() or info.st_mode & 0o077 or stat.S_ISLNK(info.st_mode):
+        raise PermissionError(f'{path} must belong to the current user and must not be accessible by others.')
+
+
+
+def _load_authkey(path, create=False):
+    ''' Reads the authkey from path. If create is True and there is no authkey yet, a random authkey is written to path first, readable only by the current user.'''
+
+    if create:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_hex(32).encode())
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No authkey found at {path}. Is the render service running?')
+
+    _check_private(path)
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+
+def _start_executor(workers):
+
+    executor = futures.ProcessPoolExecutor(max_workers=workers, initializer=batch._init_batch_worker)
+
+    # Start all workers now, rather than when the first jobs arrive
+    futures.wait([executor.submit(os.getpid) for i in range(workers)])
+
+    return executor
+
+
+
+def _restart_executor(pool, broken):
+    ''' Replaces a process pool that broke (e.g. because a worker crashed or was killed), unless another thread already did'''
+
+    with pool['lock']:
+        if pool['executor'] is broken:
+            broken.shutdown(wait=False)
+            pool['executor'] = _start_executor(pool['workers'])
+
+
+
+def _handle_connection(conn, pool, stop, options):
+
+    with conn:
+        try:
+            message = conn.recv()
+
+            if message['command'] == 'ping':
+                conn.send({'status': 'ok'})
+
+            elif message['command'] == 'render':
+                executor = pool['executor']
+
+                try:
+                    jobs = [executor.submit(_render_job, job, options['load_func']) for job in message['jobs']]
+                except futures.BrokenExecutor:
+                    # A worker of the pool died since the last request
+                    _restart_executor(pool, executor)
+                    executor = pool['executor']
+                    jobs = [executor.submit(_render_job, job, options['load_func']) for job in message['jobs']]
+
+                results = []
+
+                for job, future in zip(message['jobs'], jobs):
+                    try:
+                        results.append(future.result())
+                    except Exception as error:
+                        # E.g. a worker process that died, or a job that could not be pickled. A pool with a dead worker is replaced, so that later requests still work.
+                        if isinstance(error, futures.BrokenExecutor):
+                            _restart_executor(pool, executor)
+
+                        results.append({'output': job.get('output'), 'status': 'failed', 'error': traceback.format_exc(), 'time': None})
+
+                conn.send({'status': 'ok', 'results': results})
+
+            elif message['command'] == 'shutdown':
+                stop.set()
+                conn.send({'status': 'ok'})
+
+                with connection.Client(options['address'], authkey=options['authkey']):
+                    pass
+
+            else:
+                conn.send({'status': 'failed', 'error': f'Unknown command {message["command"]}'})
+
+        except (EOFError, OSError):
+            # The client disconnected
+            pass
+
+        except Exception:
+            try:
+                conn.send({'status': 'failed', 'error': traceback.format_exc()})
+            except (EOFError, OSError):
+                pass
+
+
+
+_functions = {}
+
+
+def _render_job(job, load_func=None):
+    ''' Renders a job in a worker process. Functions given as 'module:function' are imported once per worker.'''
+
+    func = job['func']
+
+    if isinstance(func, str):
+        if func not in _functions.keys():
+            module, name = func.split(':')
+            _functions[func] = getattr(importlib.import_module(module), name)
+
+        func = _functions[func]
+
+    return batch.render_job(func=func, job=job, load_func=load_func, savefig_kwargs=job.get('savefig_kwargs', {}))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import plotter.auxillary as aux
+import plotter.decimation as decimation
+import plotter.draft as draft
+import plotter.instrumentation as inst
+
+import importlib
+import os
+
+# Imported the first time it is used (see aux.lazy_import)
+np = aux.lazy_import('numpy')
+
+
+def get_default_streaming_options():
+    ''' Returns the default options for reading data sources in chunks'''
+
+    default_options = {
+        'chunk_size': 2**20, # Number of rows read at a time
+        'x_column': 0, # Column (index, or name for Parquet-files) of the x-values. If None, the row number is used.
+        'y_column': 1, # Column (index, or name for Parquet-files) of the y-values
+        'xlim': None, 'ylim': None, # Range of the data to reduce. Defaults to the limits of ax if these are set, otherwise to the range of the data, which takes an extra pass over it.
+    }
+
+    return default_options
+
+
+
+@draft.recordable
+def plot(ax, source, options={}, **kwargs):
+    ''' Plots a line on ax like ax.plot(x, y, **kwargs) from a data source that does not have to fit in memory. The data is streamed in chunks and reduced to the first point, the minimum, the maximum and the last point
+    of every pixel column of ax (see decimation.minmax), so that only a few points per pixel reach matplotlib. x has to be sorted in ascending order.
+
+    See iterate_chunks for the data sources that can be used. Returns the list of Line2D-objects from ax.plot.'''
+
+    options = aux.update_options(options=options, default_options=get_default_streaming_options())
+
+    timer = inst.stages('streaming.plot', options)
+
+    x, y = reduce_minmax(ax=ax, source=source, options=options)
+
+    timer.lap('reduce')
+
+    lines = ax.plot(x, y, **kwargs)
+
+    timer.lap('draw')
+    timer.finish()
+
+    return lines
+
+
+
+@draft.recordable
+def histogram2d(ax, source, options={}, **kwargs):
+    ''' Draws a 2D-histogram of the points of a data source on ax, binned at the resolution of the Axes-object, as a single image. The data is streamed in chunks, so it does not have to fit in memory.
+    Bins without any points are left transparent.
+
+    See iterate_chunks for the data sources that can be used, and reduce_histogram2d for the binning. Any keyword arguments are passed on to ax.imshow. Returns the AxesImage.'''
+
+    default_options = get_default_streaming_options()
+    default_options.update({
+        'bins_per_pixel': 1, # Number of bins along each axis per pixel
+        'cmap': 'viridis',
+        'norm': 'log', # Normalisation of the counts, passed on to ax.imshow
+    })
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    timer = inst.stages('streaming.histogram2d', options)
+
+    counts, xlim, ylim = reduce_histogram2d(ax=ax, source=source, options=options)
+
+    timer.lap('reduce')
+
+    image = ax.imshow(np.ma.masked_equal(counts, 0), extent=(xlim[0], xlim[1], ylim[0], ylim[1]), origin='lower', aspect='auto', interpolation='nearest', cmap=options['cmap'], norm=options['norm'], **kwargs)
+
+    timer.lap('draw')
+    timer.finish()
+
+    return image
+
+
+
+def reduce_minmax(ax, source, options={}):
+    ''' Streams the chunks of source through decimation.minmax with one bin per pixel column of ax. Returns the reduced x and y.'''
+
+    default_options = get_default_streaming_options()
+    default_options['decimation_points_per_pixel'] = 1 # Number of bins per horizontal pixel
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    n_bins = int(np.ceil(decimation.axes_pixel_width(ax) * options['decimation_points_per_pixel']))
+    xlim, = get_axes_limits(ax, source, options, columns=('x',))
+
+    reduced_x, reduced_y = [], []
+
+    for x, y in iterate_chunks(source, options):
+        x, y = decimation.minmax(x, y, n_bins=n_bins, xlim=xlim)
+
+        reduced_x.append(x)
+        reduced_y.append(y)
+
+    if not reduced_x:
+        return np.array([]), np.array([])
+
+    return np.concatenate(reduced_x), np.concatenate(reduced_y)
+
+
+
+def reduce_histogram2d(ax, source, options={}):
+    ''' Streams the chunks of source into a 2D-histogram with options['bins_per_pixel'] bins per pixel of ax. Points that are not finite or fall outside the limits are ignored.
+
+    Returns the counts as a (rows, columns)-array with the lowest y-values in the first row, and the x- and y-limits of the histogram.'''
+
+    default_options = get_default_streaming_options()
+    default_options['bins_per_pixel'] = 1
+
+    options = aux.update_options(options=options, default_options=default_options)
+
+    shape = (max(int(np.ceil(decimation.axes_pixel_height(ax) * options['bins_per_pixel'])), 1), max(int(np.ceil(decimation.axes_pixel_width(ax) * options['bins_per_pixel'])), 1))
+
+    xlim, ylim = get_axes_limits(ax, source, options)
+
+    counts = np.zeros(shape[0]*shape[1], dtype=np.int64)
+
+    for x, y in iterate_chunks(source, options):
+        counts += bin_points(x, y, xlim=xlim, ylim=ylim, shape=shape)
+
+    return counts.reshape(shape), xlim, ylim
+
+
+
+def bin_points(x, y, xlim, ylim, shape, weights=None):
+    ''' Counts the points (x, y) in a grid of shape (rows, columns) spanning xlim and ylim, or sums their weights if passed. Returns the flattened grid, so that chunks can be added together.'''
+
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+    rows, columns = shape
+
+    inside = (x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) & (y <= ylim[1])
+
+    if not inside.all():
+        x, y = x[inside], y[inside]
+        weights = weights[inside] if weights is not None else None
+
+    # Points on the upper limits belong to the last bin
+    ix = np.minimum(((x - xlim[0]) * (columns / (xlim[1] - xlim[0]))).astype(np.intp), columns-1)
+    iy = np.minimum(((y - ylim[0]) * (rows / (ylim[1] - ylim[0]))).astype(np.intp), rows-1)
+
+    return np.bincount(iy*columns + ix, weights=weights, minlength=rows*columns)
+
+
+
+def get_limits(source, options={}, columns=('x', 'y')):
+    ''' Returns the (min, max) of the finite values of each of the columns of source, in one pass over the data'''
+
+    options = aux.update_options(options=options, default_options=get_default_streaming_options())
+
+    limits = [[np.inf, -np.inf] for column in columns]
+
+    for chunk in iterate_chunks(source, options, columns=columns):
+        for limit, values in zip(limits, chunk):
+            values = values[np.isfinite(values)]
+
+            if len(values) > 0:
+                limit[0], limit[1] = min(limit[0], values.min()), max(limit[1], values.max())
+
+    return [tuple(limit) for limit in limits]
+
+
+
+def get_axes_limits(ax, source, options, columns=('x', 'y')):
+    ''' Returns the limits to reduce each of the columns to: those in options, the limits of ax if these are not autoscaled, or the range of the data, which is found in a single pass for all columns that need it'''
+
+    limits = {}
+
+    for column, axis in (('x', ax.xaxis), ('y', ax.yaxis)):
+        if column not in columns:
+            continue
+
+        if options[f'{column}lim'] is not None:
+            limits[column] = tuple(options[f'{column}lim'])
+        elif not (ax.get_autoscalex_on() if column == 'x' else ax.get_autoscaley_on()):
+            limits[column] = tuple(sorted(axis.get_view_interval()))
+
+    missing = [column for column in columns if column not in limits.keys()]
+
+    if missing:
+        for column, (low, high) in zip(missing, get_limits(source, options, columns=missing)):
+            if not np.isfinite(low):
+                low, high = 0., 1.
+            elif low == high:
+                low, high = low - 0.5, high + 0.5
+
+            limits[column] = (low, high)
+
+    return [limits[column] for column in columns]
+
+
+
+def iterate_chunks(source, options={}, columns=('x', 'y')):
+    ''' Yields a tuple with the requested columns ('x' and/or 'y') of source as float arrays, options['chunk_size'] rows at a time. source can be:
+        - an array (e.g. an np.memmap) with one value per row, which is used as y with the row number as x, or with one row per point, where the columns are set by options['x_column'] and options['y_column']
+        - a path to a .npy-file, which is opened as an np.memmap and used as an array
+        - a path to a .parquet-file, which is read in batches (requires pyarrow)
+        - a dictionary with 'y' and (optionally) 'x', each an array or path to a .npy-file with one value per row, e.g. for data saved as one file per column
+        - a list of any of the above, which are read one after another as consecutive chunks of the same data
+
+    Only the chunk being read is held in memory.'''
+
+    options = aux.update_options(options=options, default_options=get_default_streaming_options())
+
+    offset = 0
+
+    for chunk in _iterate_source(source, options, columns):
+        # Fill in the row number where there is no x-column
+        if 'x' in columns and chunk['x'] is None:
+            chunk['x'] = np.arange(offset, offset + chunk['length'])
+
+        offset += chunk['length']
+
+        yield tuple(np.asarray(chunk[column], dtype=float) for column in columns)
+
+
+
+def open_array(path):
+    ''' Opens a .npy-file as a read-only np.memmap, so that only the parts that are used are read from disk'''
+
+    return np.load(path, mmap_mode='r')
+
+
+
+def _iterate_source(source, options, columns):
+
+    if isinstance(source, list):
+        for part in source:
+            yield from _iterate_source(part, options, columns)
+
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        extension = os.path.splitext(source)[1].lower()
+
+        if extension == '.parquet':
+            yield from _iterate_parquet(source, options, columns)
+            return
+
+        elif extension == '.npy':
+            source = open_array(source)
+
+        else:
+            raise ValueError(f'Unknown file type {extension}. Use .npy or .parquet.')
+
+    if isinstance(source, dict):
+        x = _open(source['x']) if 'x' in source.keys() and source['x'] is not None else None
+        y = _open(source['y'])
+
+    elif source.ndim == 1:
+        x, y = None, source
+
+    else:
+        x = source[:, options['x_column']] if options['x_column'] is not None else None
+        y = source[:, options['y_column']]
+
+    for start in range(0, len(y), options['chunk_size']):
+        stop = min(start + options['chunk_size'], len(y))
+
+        yield {
+            'x': x[start:stop] if x is not None and 'x' in columns else None,
+            'y': y[start:stop] if 'y' in columns else None,
+            'length': stop - start,
+        }
+
+
+
+def _iterate_parquet(path, options, columns):
+
+    try:
+        parquet = importlib.import_module('pyarrow.parquet')
+    except ImportError:
+        raise ImportError('Reading .parquet-files requires pyarrow to be installed.')
+
+    f = parquet.ParquetFile(path)
+
+    names = {}
+    for column in ('x', 'y'):
+        name = options[f'{column}_column']
+        names[column] = f.schema_arrow.names[name] if isinstance(name, int) else name
+
+    # Only the requested columns are read. If no column is requested (only the row number), the y-column is read to know the length of each batch.
+    read = [names[column] for column in columns if names[column] is not None] or [names['y']]
+
+    for batch in f.iter_batches(batch_size=options['chunk_size'], columns=list(dict.fromkeys(read))):
+        yield {
+            'x': batch.column(names['x']).to_numpy(zero_copy_only=False) if names['x'] is not None and 'x' in columns else None,
+            'y': batch.column(names['y']).to_numpy(zero_copy_only=False) if 'y' in columns else None,
+            'length': batch.num_rows,
+        }
+
+
+
+def _open(source):
+
+    return open_array(source) if isinstance(source, (str, os.PathLike)) else source
@@ -0,0 +1,57 @@
+import os
+import stat
+import subprocess
+import sys
+
+import plotter.cache as cache
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A membership test against a literal set is compiled to a frozenset constant
+KEY_SCRIPT = '''
+import plotter.cache as cache
+
+def render(data, options, path):
+    if options.get('kind') in {'line', 'scatter', 'bar', 'step'}:
+        pass
+
+print(cache.cache_key(data=[1, 2, 3], options={}, extension='.png', render_func=render))
+'''
+
+
+def _key_with_hash_seed(seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=ROOT)
+
+    return subprocess.run([sys.executable, '-c', KEY_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def test_cache_key_with_set_constant():
+    keys = {_key_with_hash_seed(seed) for seed in (1, 2, 3)}
+
+    assert len(keys) == 1
+
+
+def test_cache_key_with_set_data():
+    assert cache.cache_key(data={'a', 'b', 'c'}, options={}) == cache.cache_key(data={'c', 'b', 'a'}, options={})
+    assert cache.cache_key(data={'a', 'b'}, options={}) != cache.cache_key(data={'a', 'c'}, options={})
+
+
+def test_cached_render_follows_umask(tmp_path):
+    def render(data, options, path):
+        with open(path, 'w') as f:
+            f.write(str(data))
+
+    cache_options = {'cache_folder': str(tmp_path / 'cache')}
+    umask = os.umask(0o022)
+
+    try:
+        cache.cached_render(render, [1], {}, str(tmp_path / 'first.txt'), cache_options)
+        result = cache.cached_render(render, [1], {}, str(tmp_path / 'second.txt'), cache_options)
+    finally:
+        os.umask(umask)
+
+    assert result['hit']
+
+    for path in [tmp_path / 'second.txt'] + list((tmp_path / 'cache').glob('*.txt')):
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
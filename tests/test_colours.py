@@ -0,0 +1,16 @@
+import numpy as np
+
+import plotter.colours as colours
+
+
+def test_make_gradient_single_stop():
+    gradient = colours.make_gradient([(0.2, 0.4, 0.6)], {'number_of_colours': 5})
+
+    assert gradient.shape == (5, 3)
+    assert np.allclose(gradient, (0.2, 0.4, 0.6))
+
+
+def test_make_gradient_two_stops():
+    gradient = colours.make_gradient([(0, 0, 0), (1, 1, 1)], {'number_of_colours': 3})
+
+    assert np.allclose(gradient, [(0, 0, 0), (0.5, 0.5, 0.5), (1, 1, 1)])
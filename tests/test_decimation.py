@@ -0,0 +1,31 @@
+import numpy as np
+
+import plotter.decimation as decimation
+
+
+def test_minmax_keeps_gaps():
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 100)
+    y[4000:4500] = np.nan
+
+    xd, yd = decimation.minmax(x, y, n_bins=100)
+
+    # The line is broken where the data has a gap
+    assert np.isnan(yd).any()
+    assert np.all(np.isnan(yd[(xd >= 4000) & (xd < 4500)]))
+
+    # The finite points on either side of the gap are still kept
+    assert xd[np.flatnonzero(np.isnan(yd))[0] - 1] < 4000
+    assert np.nanmax(yd) == np.nanmax(y)
+    assert np.nanmin(yd) == np.nanmin(y)
+
+
+def test_minmax_without_nan():
+    x = np.arange(10000, dtype=float)
+    y = np.cos(x / 50)
+
+    xd, yd = decimation.minmax(x, y, n_bins=100)
+
+    assert not np.isnan(yd).any()
+    assert len(xd) <= 4 * 100
+    assert np.all(np.diff(xd) > 0)